@@ -2,13 +2,14 @@
 import streamlit as st
 import cv2
 import numpy as np
-from PIL import Image as PILImage 
 import tempfile
 import os
 import time
+import queue
+import threading
+import concurrent.futures
 from datetime import datetime
 import logging
-import gc 
 
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -19,16 +20,19 @@ except ImportError:
     st.error("❌ Gagal mengimpor YoloDetector dari detector.py. Pastikan file dan nama kelas sudah benar.")
     st.stop()
 
-from notifier import send_telegram_notification, send_whatsapp_notification
-from gemini_analyzer import analyze_image_with_gemini, GEMINI_API_KEY 
-from utils import apply_clahe_enhancement, image_bytes_to_rgb_numpy
+from notifier import send_all_notifications
+from gemini_analyzer import analyze_image_with_gemini_batched, GEMINI_API_KEY
+from utils import image_bytes_to_bgr_numpy, scale_and_draw_detections
 
 MODEL_PATH_DEFAULT = 'best.pt' 
 MODEL_PATH = os.getenv('MODEL_PATH', MODEL_PATH_DEFAULT) 
-HEADER_IMAGE_PATH = "fireman.jpg" 
+HEADER_IMAGE_PATH = "fireman.jpg"
+# Dihitung sekali saat modul dimuat, bukan di setiap rerun sidebar:
+# tzinfo lokal stabil selama proses hidup, begitu pula keberadaan file header.
+_LOCAL_TZ = datetime.now().astimezone().tzinfo
+HEADER_IMAGE_EXISTS = os.path.exists(HEADER_IMAGE_PATH)
 
 
-if 'detector' not in st.session_state: st.session_state.detector = None
 if 'model_loaded_successfully' not in st.session_state: st.session_state.model_loaded_successfully = False
 if 'last_notification_time' not in st.session_state: st.session_state.last_notification_time = {} 
 if 'processing_active' not in st.session_state: st.session_state.processing_active = False 
@@ -37,18 +41,41 @@ if 'gemini_available' not in st.session_state: st.session_state.gemini_available
 if 'whatsapp_configured' not in st.session_state: 
     st.session_state.whatsapp_configured = bool(os.getenv('CALLMEBOT_API_KEY') and os.getenv('RECEIVER_WHATSAPP_NUMBER'))
 
+@st.cache_resource
+def _load_yolo(model_path: str) -> YoloDetector:
+    """
+    Memuat YoloDetector sekali per proses dan membagikannya antar sesi/rerun.
+    Tanpa cache ini, setiap rerun Streamlit berpotensi memuat ulang bobot
+    model (ratusan MB) ke memori/VRAM.
+    """
+    return YoloDetector(model_path=model_path)
+
+@st.cache_resource
+def _get_notify_pool() -> concurrent.futures.ThreadPoolExecutor:
+    """
+    Pool thread bersama untuk Gemini/Telegram/WhatsApp. Tanpa ini, tiap
+    notifikasi memblokir loop video selama beberapa RTT HTTP (>1 detik
+    untuk tiga panggilan berurutan).
+    """
+    return concurrent.futures.ThreadPoolExecutor(max_workers=4, thread_name_prefix="detectorx-notify")
+
+@st.cache_data
+def _alert_classes_caption(model_path: str) -> str:
+    """Menyusun caption kelas target notifikasi sekali, tidak di setiap rerun."""
+    detector = _load_yolo(model_path)
+    alert_classes = ['fire', 'smoke']
+    display_classes = [cls for cls in detector.class_names.values() if cls.lower() in alert_classes]
+    return ', '.join(display_classes)
+
 def initialize_detector(model_path_to_load):
     try:
-        st.session_state.detector = YoloDetector(model_path=model_path_to_load)
-        if st.session_state.detector.model: 
+        st.session_state.detector = _load_yolo(model_path_to_load)
+        if st.session_state.detector.model:
             st.session_state.model_loaded_successfully = True
             logger.info(f"Detector berhasil diinisialisasi dengan model: {model_path_to_load}")
             st.sidebar.success(f"✅ Model '{os.path.basename(model_path_to_load)}' dimuat!")
             # DIUBAH: Menampilkan hanya kelas target notifikasi ('fire', 'smoke') di sidebar
-            alert_classes = ['fire', 'smoke']
-            all_model_classes = st.session_state.detector.class_names.values()
-            display_classes = [cls for cls in all_model_classes if cls.lower() in alert_classes]
-            st.sidebar.caption(f"Kelas Target Notifikasi: {', '.join(display_classes)}")
+            st.sidebar.caption(f"Kelas Target Notifikasi: {_alert_classes_caption(model_path_to_load)}")
         else:
             st.session_state.model_loaded_successfully = False
             st.sidebar.error(f"❌ Gagal memuat model dari '{model_path_to_load}'.")
@@ -85,117 +112,328 @@ def attempt_remove_temp_file(file_path, max_retries=3, delay=0.1):
             logger.error(f"Error tak terduga saat hapus '{file_path}': {e}", exc_info=True)
             return 
     
-def process_frame_and_notify(frame_bgr_original_for_detection, 
-                             frame_placeholder, 
+def _send_alert_messages(message_details, jpeg_bytes, enable_telegram, enable_whatsapp):
+    """
+    Dijalankan di thread pool notifikasi: mengirim Telegram/WhatsApp tanpa
+    memblokir loop video. Tidak boleh menyentuh API st.* dari sini.
+    Fan-out lewat send_all_notifications: kedua kanal berjalan paralel dan
+    berbagi satu unggahan Imgur + satu pesan dasar per event.
+    """
+    try:
+        send_all_notifications(message_details, image_bytes=jpeg_bytes,
+                               enable_telegram=enable_telegram,
+                               enable_whatsapp=enable_whatsapp)
+    except Exception as e_send:
+        logger.error(f"Error saat mengirim notifikasi di latar belakang: {e_send}", exc_info=True)
+
+def preprocess_frame_for_detection(frame_bgr_original_for_detection, use_clahe):
+    """
+    Menyiapkan satu frame BGR (termasuk CLAHE opsional) sebelum deteksi.
+    Tidak ada .copy() defensif di sini: YOLO tidak memutasi input, dan jalur
+    CLAHE sudah menghasilkan buffer baru lewat cvtColor.
+    """
+    if use_clahe:
+        with st.spinner("⚙️ Menerapkan enhancement CLAHE..."):
+            # detector.preprocess memakai CLAHE CUDA bila tersedia, CPU jika tidak.
+            return st.session_state.detector.preprocess(frame_bgr_original_for_detection, use_clahe=True)
+    return frame_bgr_original_for_detection
+
+def _open_video_capture(source):
+    """
+    Membuka cv2.VideoCapture dengan backend eksplisit dan properti rendah-latensi.
+
+    Untuk kamera live (source berupa indeks), backend dipilih eksplisit
+    (V4L2 di Linux, DirectShow di Windows), buffer driver dipangkas ke 1 frame
+    agar frame yang dibaca selalu yang terbaru, MJPG diminta agar driver tidak
+    melakukan konversi YUV422->BGR, dan resolusi dibatasi 1280x720 supaya tidak
+    menerima frame 4K hanya untuk diperkecil lagi. File video tetap memakai
+    backend default.
+    """
+    if isinstance(source, int):
+        backend = cv2.CAP_DSHOW if os.name == 'nt' else cv2.CAP_V4L2
+        capture = cv2.VideoCapture(source, backend)
+        if not capture.isOpened():
+            # Fallback: beberapa driver tidak mendukung backend yang diminta.
+            capture = cv2.VideoCapture(source)
+        if capture.isOpened():
+            capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+            capture.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+            capture.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
+            capture.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
+        return capture
+    return cv2.VideoCapture(source)
+
+def _put_dropping_oldest(target_queue, item):
+    """Mendorong item ke antrian; saat penuh, buang entri terlama (jaga latensi)."""
+    try:
+        target_queue.put(item, timeout=0.05)
+    except queue.Full:
+        try: target_queue.get_nowait()
+        except queue.Empty: pass
+        try: target_queue.put_nowait(item)
+        except queue.Full: pass
+
+def _motion_thumbnail(frame_bgr):
+    """Thumbnail grayscale 64x64 untuk gerbang deteksi-perubahan antar frame."""
+    return cv2.resize(cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2GRAY), (64, 64))
+
+def _capture_worker(cv_capture, frame_queue, stop_event, is_video_file_mode=False):
+    """
+    Thread tahap-1: membaca frame dari sumber dan mendorongnya ke antrian.
+    Untuk kamera live, saat antrian penuh (inferensi lebih lambat dari sumber)
+    frame terlama dibuang agar latensi tetap rendah, bukan menumpuk. Untuk
+    video yang diunggah, put MEMBLOK (backpressure ke pembacaan file) supaya
+    SEMUA frame rekaman tetap dianalisis, bukan hanya sampel.
+    """
+    cv2.setNumThreads(1)
+    while not stop_event.is_set():
+        ret_val, frame_bgr = cv_capture.read()
+        if not ret_val:
+            frame_queue.put(None)  # Sentinel: stream berakhir
+            return
+        if is_video_file_mode:
+            # Timeout pendek hanya agar stop_event tetap terpantau.
+            while not stop_event.is_set():
+                try:
+                    frame_queue.put(frame_bgr, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+        else:
+            _put_dropping_oldest(frame_queue, frame_bgr)  # Backpressure: frame terlama dibuang
+
+def _inference_worker(detector, frame_queue, result_queue, stop_event,
+                      conf_thresh, iou_thresh, imgsz, augment_tta, use_clahe, batch_size,
+                      motion_threshold=0.0):
+    """
+    Thread tahap-2: mengambil frame dari antrian capture, menjalankan CLAHE +
+    deteksi (batched bila frame menumpuk), dan mendorong hasilnya ke antrian
+    hasil untuk dirender oleh thread utama (Streamlit).
+
+    Jika motion_threshold > 0, frame yang nyaris identik dengan frame
+    sebelumnya (absdiff rata-rata thumbnail 64x64 di bawah ambang) dilewati
+    tanpa forward pass; frame beranotasi terakhir dipakai ulang untuk tampilan.
+    """
+    cv2.setNumThreads(1)
+    stream_ended = False
+    prev_motion_thumb = None
+    last_annotated_frame = None
+    while not stop_event.is_set() and not stream_ended:
+        frames_batch = []
+        try:
+            item = frame_queue.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        if item is None:
+            break
+        frames_batch.append(item)
+        while len(frames_batch) < batch_size:  # Oportunistik: ambil frame lain yang sudah antre
+            try:
+                extra = frame_queue.get_nowait()
+            except queue.Empty:
+                break
+            if extra is None:
+                stream_ended = True
+                break
+            frames_batch.append(extra)
+
+        # Gerbang frame-differencing: buang frame statis sebelum inferensi.
+        if motion_threshold > 0:
+            frames_kept = []
+            for frame in frames_batch:
+                cur_thumb = _motion_thumbnail(frame)
+                if (prev_motion_thumb is not None and last_annotated_frame is not None
+                        and np.abs(cur_thumb.astype(np.int16) - prev_motion_thumb).mean() < motion_threshold):
+                    # Scene tidak berubah: pakai ulang frame beranotasi terakhir.
+                    _put_dropping_oldest(result_queue, ([], last_annotated_frame))
+                else:
+                    frames_kept.append(frame)
+                prev_motion_thumb = cur_thumb
+            frames_batch = frames_kept
+            if not frames_batch:
+                continue
+
+        # Resize ke lebar imgsz SEBELUM CLAHE/inferensi: CLAHE dan letterbox
+        # Ultralytics lalu bekerja pada tensor kecil, bukan frame resolusi penuh.
+        frames_small = []
+        frame_scales = []
+        for frame in frames_batch:
+            if frame.shape[1] > imgsz:
+                scale = imgsz / frame.shape[1]
+                frames_small.append(cv2.resize(
+                    frame, (imgsz, max(1, int(round(frame.shape[0] * scale)))),
+                    interpolation=cv2.INTER_LINEAR))
+                frame_scales.append(scale)
+            else:
+                frames_small.append(frame)
+                frame_scales.append(1.0)
+        any_scaled = any(s != 1.0 for s in frame_scales)
+
+        frames_to_detect = [detector.preprocess(f, use_clahe=True) for f in frames_small] if use_clahe else frames_small
+        batch_outputs = detector.detect_batch(
+            frames_to_detect,
+            confidence_threshold=conf_thresh,
+            iou_threshold=iou_thresh,
+            imgsz=imgsz,
+            augment=augment_tta,
+            annotate=not any_scaled
+        )
+        if any_scaled:
+            # Skala balik bbox ke resolusi asli dan gambar anotasi pada frame penuh,
+            # sehingga tampilan/notifikasi tetap memakai resolusi sumber.
+            batch_outputs = [
+                (dets, scale_and_draw_detections(orig_frame, dets, scale))
+                for orig_frame, scale, (dets, _small_frame)
+                in zip(frames_batch, frame_scales, batch_outputs)
+            ]
+        for output in batch_outputs:
+            last_annotated_frame = output[1]
+            _put_dropping_oldest(result_queue, output)  # UI tertinggal: hasil terlama dibuang
+    result_queue.put(None)  # Sentinel: tidak ada hasil lagi
+
+def process_frame_and_notify(frame_bgr_original_for_detection,
+                             frame_placeholder,
                              conf_thresh, iou_thresh, imgsz, augment_tta,
-                             use_clahe, notif_cooldown, 
+                             use_clahe, notif_cooldown,
                              enable_telegram, enable_whatsapp,
                              detection_log_area):
-    if not st.session_state.model_loaded_successfully or st.session_state.detector is None:
+    if not st.session_state.model_loaded_successfully or st.session_state.get('detector') is None:
         frame_placeholder.warning("⚠️ Model deteksi belum dimuat. Tidak dapat memproses.")
         return []
 
-    frame_to_detect = frame_bgr_original_for_detection.copy() 
-    if use_clahe: 
-        with st.spinner("⚙️ Menerapkan enhancement CLAHE..."):
-            frame_rgb_for_clahe = cv2.cvtColor(frame_to_detect, cv2.COLOR_BGR2RGB)
-            enhanced_frame_rgb = apply_clahe_enhancement(frame_rgb_for_clahe)
-            if enhanced_frame_rgb is not None: frame_to_detect = cv2.cvtColor(enhanced_frame_rgb, cv2.COLOR_RGB2BGR)
-            else: logger.warning("Proses CLAHE gagal, menggunakan frame asli untuk deteksi.")
-    
+    frame_to_detect = preprocess_frame_for_detection(frame_bgr_original_for_detection, use_clahe)
+
     detected_objects, annotated_frame_bgr_output = st.session_state.detector.detect(
-        frame_to_detect, 
-        confidence_threshold=conf_thresh, 
-        iou_threshold=iou_thresh, 
-        imgsz=imgsz, 
+        frame_to_detect,
+        confidence_threshold=conf_thresh,
+        iou_threshold=iou_thresh,
+        imgsz=imgsz,
         augment=augment_tta
     )
-    
-    annotated_frame_rgb_display = cv2.cvtColor(annotated_frame_bgr_output, cv2.COLOR_BGR2RGB)
-    frame_placeholder.image(annotated_frame_rgb_display, caption="🖼️ Hasil Deteksi Visual", channels="RGB", use_container_width=True)
 
-    detection_log_area.empty() 
-    if not detected_objects: 
-        detection_log_area.info("ℹ️ Tidak ada objek yang terdeteksi pada frame ini (setelah filter).")
+    return handle_detection_output(detected_objects, annotated_frame_bgr_output,
+                                   frame_placeholder, notif_cooldown,
+                                   enable_telegram, enable_whatsapp, detection_log_area)
+
+def handle_detection_output(detected_objects, annotated_frame_bgr_output,
+                            frame_placeholder, notif_cooldown,
+                            enable_telegram, enable_whatsapp,
+                            detection_log_area,
+                            render_display=True, render_log_hint=True):
+    """
+    Menampilkan hasil deteksi satu frame dan menjalankan logika notifikasi.
+
+    render_display/render_log_hint dipakai loop streaming untuk menurunkan
+    frekuensi update widget (setiap update dikirim ulang lewat websocket);
+    log tetap dirender segera saat komposisi label deteksi berubah, dan
+    logika notifikasi selalu berjalan penuh untuk setiap frame.
+    """
+    # BGR->RGB untuk tampilan cukup berupa view numpy dengan stride terbalik
+    # (zero-copy); st.image bisa mengkonsumsinya langsung. Jalur JPEG
+    # notifikasi di bawah meng-encode langsung dari buffer BGR.
+    if render_display:
+        annotated_frame_rgb_display = annotated_frame_bgr_output[:, :, ::-1]
+        frame_placeholder.image(annotated_frame_rgb_display, caption="🖼️ Hasil Deteksi Visual", channels="RGB", use_container_width=True)
 
-    detected_labels_in_frame = [] 
-    for det in detected_objects: 
-        label, confidence, bbox = det['label'].lower(), det['confidence'], det['bbox']
+    current_label_set = sorted({det.label.lower() for det in detected_objects})
+    render_log = render_log_hint or current_label_set != st.session_state.get('last_logged_label_set')
+    if render_log:
+        st.session_state.last_logged_label_set = current_label_set
+        detection_log_area.empty()
+        if not detected_objects:
+            detection_log_area.info("ℹ️ Tidak ada objek yang terdeteksi pada frame ini (setelah filter).")
+
+    # Set ID kelas pemicu sudah dihitung sekali saat model dimuat; perbandingan
+    # per deteksi di bawah cukup hash integer, tanpa .lower()/list string.
+    alert_class_ids = st.session_state.detector.alert_class_ids
+
+    detected_labels_in_frame = []
+    for det in detected_objects:
+        label, confidence, bbox = det.label.lower(), det.conf, det.box
+        is_alert_class = det.cls in alert_class_ids
         detected_labels_in_frame.append(label)
-        
+
         # --- DIUBAH: Logika Tampilan dan Notifikasi Berdasarkan Kelas ---
-        
-        # 1. Logika Tampilan di Antarmuka
-        if label in ['fire', 'smoke']:
-            detection_log_area.warning(f"🚨 **TERDETEKSI:** `{label.capitalize()}` (Kepercayaan: {confidence:.2f}) pada bbox: `{bbox}`")
-        else: # Untuk 'neutral' dan kelas lainnya
-            detection_log_area.info(f"⚪️ **INFO:** Terdeteksi objek `{label.capitalize()}` (Kepercayaan: {confidence:.2f}) pada bbox: `{bbox}`")
+
+        # 1. Logika Tampilan di Antarmuka (mengikuti throttling render_log)
+        if render_log:
+            if is_alert_class:
+                detection_log_area.warning(f"🚨 **TERDETEKSI:** `{label.capitalize()}` (Kepercayaan: {confidence:.2f}) pada bbox: `{bbox}`")
+            else: # Untuk 'neutral' dan kelas lainnya
+                detection_log_area.info(f"⚪️ **INFO:** Terdeteksi objek `{label.capitalize()}` (Kepercayaan: {confidence:.2f}) pada bbox: `{bbox}`")
 
         # 2. Logika Notifikasi (HANYA untuk kelas berbahaya)
-        if label in ['fire', 'smoke'] and can_send_notification(label, notif_cooldown):
+        if is_alert_class and can_send_notification(label, notif_cooldown):
             timestamp_dt = datetime.now()
             timestamp_str = timestamp_dt.strftime("%Y-%m-%d %H:%M:%S")
             
-            temp_annotated_img_path = None 
-            fp_temp_annotated_obj = None   
-            pil_annotated_for_saving = None 
-            gemini_analysis_result = None 
-            
             try:
-                pil_annotated_for_saving = PILImage.fromarray(cv2.cvtColor(annotated_frame_bgr_output, cv2.COLOR_BGR2RGB))
-                fp_temp_annotated_obj = tempfile.NamedTemporaryFile(delete=False, suffix=".jpg", prefix="det_annotated_")
-                pil_annotated_for_saving.save(fp_temp_annotated_obj, format="JPEG")
-                temp_annotated_img_path = fp_temp_annotated_obj.name 
-                fp_temp_annotated_obj.close(); fp_temp_annotated_obj = None 
-                logger.info(f"Frame ANOTASI disimpan ke file temporer: {temp_annotated_img_path}")
-                
-                if temp_annotated_img_path and st.session_state.gemini_available and st.session_state.analyze_with_gemini: 
-                    with st.spinner(f"🧠 Menganalisis deteksi {label} dengan Gemini AI..."):
-                        
-                        gemini_prompt = (f"Gambar ini menampilkan deteksi '{label}' dari sumber '{st.session_state.current_input_source_name}' yang berlokasi di '{st.session_state.location_name}'. "
-                                         "Berikan analisis singkat mengenai potensi bahaya berdasarkan apa yang terlihat pada gambar, "
-                                         "kemungkinan penyebab (jika bisa disimpulkan dari visual), dan langkah-langkah keamanan dasar yang harus segera diambil. "
-                                         "Fokus pada respons cepat dan tindakan preventif. Buat dalam format narasi atau poin singkat yang mudah dipahami.")
-
-                        gemini_analysis_result = analyze_image_with_gemini(temp_annotated_img_path, gemini_prompt) 
-                    
-                    with detection_log_area.expander(f"🔬 Analisis & Saran dari Gemini AI untuk {label.capitalize()}", expanded=True):
-                        st.markdown(gemini_analysis_result if gemini_analysis_result else "Tidak ada analisis yang diterima dari Gemini AI.")
-                
+                # Encode JPEG langsung dari buffer BGR di memori — tanpa PIL,
+                # tanpa file temporer, tanpa retry penghapusan file.
+                encode_ok, jpeg_buffer = cv2.imencode('.jpg', annotated_frame_bgr_output, [cv2.IMWRITE_JPEG_QUALITY, 85])
+                annotated_jpeg_bytes = jpeg_buffer.tobytes() if encode_ok else None
+                if annotated_jpeg_bytes is None:
+                    logger.warning("Gagal meng-encode frame anotasi ke JPEG; notifikasi dikirim tanpa gambar.")
+
                 message_details_for_notif = {
                     'detection_type': label.capitalize(),
                     'location': st.session_state.location_name,
                     'source_info': st.session_state.current_input_source_name,
                     'confidence': confidence,
                     'timestamp': timestamp_str,
-                    'gemini_analysis': gemini_analysis_result 
+                    'gemini_analysis': None
                 }
+                send_whatsapp_enabled = enable_whatsapp and st.session_state.whatsapp_configured
+
+                # Semua panggilan jaringan (Gemini, Telegram, WhatsApp) berjalan
+                # di thread pool agar loop capture->inferensi tidak terhenti
+                # beberapa detik per deteksi. Cooldown langsung diperbarui saat
+                # submit, bukan saat pengiriman selesai.
+                notify_pool = _get_notify_pool()
+                run_gemini = (annotated_jpeg_bytes is not None
+                              and st.session_state.gemini_available
+                              and st.session_state.analyze_with_gemini)
+                if run_gemini:
+                    gemini_prompt = (f"Gambar ini menampilkan deteksi '{label}' dari sumber '{st.session_state.current_input_source_name}' yang berlokasi di '{st.session_state.location_name}'. "
+                                     "Berikan analisis singkat mengenai potensi bahaya berdasarkan apa yang terlihat pada gambar, "
+                                     "kemungkinan penyebab (jika bisa disimpulkan dari visual), dan langkah-langkah keamanan dasar yang harus segera diambil. "
+                                     "Fokus pada respons cepat dan tindakan preventif. Buat dalam format narasi atau poin singkat yang mudah dipahami.")
+                    # Jalur batched: deteksi beruntun dalam jendela singkat digabung
+                    # menjadi satu panggilan Gemini multi-gambar.
+                    gemini_future = notify_pool.submit(
+                        analyze_image_with_gemini_batched, gemini_prompt, annotated_jpeg_bytes)
+
+                    def _after_gemini_analysis(finished_future,
+                                               details=message_details_for_notif,
+                                               jpeg_bytes=annotated_jpeg_bytes,
+                                               tg=enable_telegram, wa=send_whatsapp_enabled,
+                                               pool=notify_pool):
+                        # Callback berjalan di thread pool: rangkai hasil Gemini
+                        # ke pesan, lalu kirim — tanpa menyentuh st.*.
+                        analysis_text = None
+                        try:
+                            analysis_text = finished_future.result()
+                        except Exception as e_gemini:
+                            logger.error(f"Analisis Gemini di latar belakang gagal: {e_gemini}", exc_info=True)
+                        pool.submit(_send_alert_messages,
+                                    {**details, 'gemini_analysis': analysis_text},
+                                    jpeg_bytes, tg, wa)
+
+                    gemini_future.add_done_callback(_after_gemini_analysis)
+                    if render_log:
+                        detection_log_area.info(
+                            f"🧠 Analisis Gemini untuk {label.capitalize()} berjalan di latar belakang; "
+                            "hasilnya disertakan langsung pada notifikasi.")
+                else:
+                    notify_pool.submit(_send_alert_messages, message_details_for_notif,
+                                       annotated_jpeg_bytes, enable_telegram, send_whatsapp_enabled)
+
+                update_notification_time(label)
 
-                if enable_telegram:
-                    with st.spinner(f"📲 Mengirim notifikasi Telegram untuk deteksi {label}..."):
-                        send_telegram_notification(message_details_for_notif, image_path_annotated=temp_annotated_img_path)
-                
-                if enable_whatsapp and st.session_state.whatsapp_configured:
-                    with st.spinner(f"📱 Mengirim notifikasi WhatsApp untuk deteksi {label}..."):
-                        send_whatsapp_notification(message_details_for_notif, image_path_annotated=temp_annotated_img_path)
-                
-                update_notification_time(label) 
-            
             except Exception as e_notify_main:
                 detection_log_area.error(f"❌ Terjadi error saat proses notifikasi atau analisis Gemini: {e_notify_main}")
                 logger.error(f"Error dalam loop notifikasi/analisis Gemini utama: {e_notify_main}", exc_info=True)
-            
-            finally:
-                if hasattr(pil_annotated_for_saving, 'close'): 
-                    try: pil_annotated_for_saving.close() 
-                    except: pass
-                if fp_temp_annotated_obj is not None : 
-                    try: fp_temp_annotated_obj.close()
-                    except: pass
-                gc.collect() 
-                if temp_annotated_img_path: 
-                    attempt_remove_temp_file(temp_annotated_img_path) 
-        elif label in ['fire', 'smoke']: # Kondisi ini hanya untuk menampilkan pesan cooldown jika notifikasi belum bisa dikirim
+        elif is_alert_class and render_log: # Kondisi ini hanya untuk menampilkan pesan cooldown jika notifikasi belum bisa dikirim
             detection_log_area.info(f"⏳ Notifikasi untuk deteksi {label} masih dalam masa cooldown.")
             
     return list(set(detected_labels_in_frame)) 
@@ -203,7 +441,7 @@ def process_frame_and_notify(frame_bgr_original_for_detection,
 st.set_page_config(page_title="🔥💨 DetectorX - Sistem Deteksi Cerdas", layout="wide", initial_sidebar_state="expanded")
 col_header1, col_header2 = st.columns([1, 6]) 
 with col_header1:
-    if os.path.exists(HEADER_IMAGE_PATH): st.image(HEADER_IMAGE_PATH, width=100) 
+    if HEADER_IMAGE_EXISTS: st.image(HEADER_IMAGE_PATH, width=100)
     else: st.caption(f"Logo '{HEADER_IMAGE_PATH}' tidak ditemukan.") 
 with col_header2: st.title("🔥 DetectorX - Sistem Deteksi Api & Asap Cerdas 💨")
 st.markdown("Selamat datang! Aplikasi ini menggunakan AI untuk mendeteksi api & asap secara *real-time*.")
@@ -212,17 +450,19 @@ st.markdown("---")
 with st.sidebar:
     st.header("⚙️ Konfigurasi Sistem")
     st.session_state.location_name = st.text_input("📍 Nama/ID Lokasi", value="Area Produksi")
-    if not st.session_state.detector and not st.session_state.model_loaded_successfully:
-        if os.path.exists(MODEL_PATH): initialize_detector(MODEL_PATH)
-        else: st.error(f"❌ Model '{MODEL_PATH}' tidak ditemukan.")
+    # Aman dipanggil setiap rerun: @st.cache_resource mengembalikan instance yang sama.
+    if os.path.exists(MODEL_PATH): initialize_detector(MODEL_PATH)
+    else: st.error(f"❌ Model '{MODEL_PATH}' tidak ditemukan.")
     
     with st.expander("🔧 Parameter Deteksi", expanded=False):
         conf_thresh_slider = st.slider("🎯 Kepercayaan", 0.05, 1.0, 0.15, 0.05, help="Ambang keyakinan deteksi.") 
         iou_thresh_slider = st.slider("🔗 IoU (NMS)", 0.1,1.0,0.45,0.05, help="Kontrol tumpang tindih kotak deteksi.")
         imgsz_slider = st.select_slider("🖼️ Ukuran Input", [320,416,512,640,720,1024],640, help="Ukuran gambar input model.")
         augment_tta_checkbox = st.checkbox("✨ Augmentasi (TTA)", False, help="Test-Time Augmentation.")
+        batch_size_slider = st.select_slider("📦 Batch Frame (Video/Kamera)", [1,2,4,8], 4, help="Jumlah frame stream yang dideteksi dalam satu panggilan model.")
     with st.expander("✨ Pra-pemrosesan", expanded=False):
         use_clahe_checkbox = st.checkbox("🔆 Aktifkan CLAHE", False, help="Tingkatkan kontras gambar.")
+        motion_threshold_slider = st.slider("🎛️ Ambang Gerakan", 0.0, 10.0, 0.0, 0.5, help="Lewati inferensi pada frame stream yang nyaris identik dengan frame sebelumnya. 0 = selalu deteksi.")
     st.markdown("---")
     st.header("🔔 Notifikasi & AI")
     with st.expander("📢 Notifikasi", expanded=True):
@@ -238,7 +478,7 @@ with st.sidebar:
         st.info("ℹ️ Gemini AI tidak tersedia.")
         st.session_state.analyze_with_gemini = False
 
-    st.markdown(f"---<br><small>🕒 {datetime.now(tz=datetime.now().astimezone().tzinfo).strftime('%d %b %Y, %H:%M:%S %Z')}</small><br><small>Versi Aplikasi 2.3.4</small>", unsafe_allow_html=True)
+    st.markdown(f"---<br><small>🕒 {datetime.now(tz=_LOCAL_TZ).strftime('%d %b %Y, %H:%M:%S %Z')}</small><br><small>Versi Aplikasi 2.3.4</small>", unsafe_allow_html=True)
 
 main_col, log_col = st.columns([3, 2])
 with main_col:
@@ -272,14 +512,15 @@ else:
             st.session_state.current_input_source_name = f"Unggahan Gambar: {uploaded_file_img.name}" 
             try:
                 img_bytes_data = uploaded_file_img.getvalue()
-                img_rgb_numpy_data = image_bytes_to_rgb_numpy(img_bytes_data)
-                if img_rgb_numpy_data is not None:
-                    frame_placeholder.image(img_rgb_numpy_data, caption="🖼️ Gambar Asli", use_container_width=True) 
+                # Decode langsung ke BGR (native cv2.imdecode); Streamlit bisa
+                # menampilkan BGR via channels="BGR" tanpa konversi tambahan.
+                img_bgr_numpy_data = image_bytes_to_bgr_numpy(img_bytes_data)
+                if img_bgr_numpy_data is not None:
+                    frame_placeholder.image(img_bgr_numpy_data, caption="🖼️ Gambar Asli", channels="BGR", use_container_width=True)
                     if st.button("🔍 Deteksi Gambar", type="primary", use_container_width=True):
                         with st.spinner("⏳ Mendeteksi objek pada gambar..."):
-                            frame_bgr_for_detection = cv2.cvtColor(img_rgb_numpy_data, cv2.COLOR_RGB2BGR)
                             process_frame_and_notify(
-                                frame_bgr_for_detection, 
+                                img_bgr_numpy_data,
                                 frame_placeholder, 
                                 *common_args_for_processing
                             )
@@ -320,28 +561,62 @@ else:
             video_capture_source = temp_video_file_path if is_video_file_mode and temp_video_file_path else 0
             if is_video_file_mode and not temp_video_file_path : st.session_state.processing_active = False 
             if st.session_state.processing_active: 
-                cv_video_capture = cv2.VideoCapture(video_capture_source)
+                cv_video_capture = _open_video_capture(video_capture_source)
                 if not cv_video_capture.isOpened(): 
                     st.error(f"❌ Gagal buka sumber input: {'File Video' if is_video_file_mode else 'Kamera Web'}."); st.session_state.processing_active = False 
                 else:
                     detection_log_area.info(f"⏳ Memulai pemrosesan {'video' if is_video_file_mode else 'kamera live'}...")
-                    while cv_video_capture.isOpened() and st.session_state.processing_active:
-                        ret_val, frame_bgr_from_stream = cv_video_capture.read() 
-                        if not ret_val: 
-                            detection_log_area.success(f"✅ Pemrosesan {'video selesai.' if is_video_file_mode else 'stream kamera berakhir.'}"); 
-                            st.session_state.processing_active = False; break 
-                        
-                        process_frame_and_notify(
-                            frame_bgr_from_stream, 
-                            frame_placeholder, 
-                            *common_args_for_processing
-                        )
-                        time.sleep(0.01) 
-                    cv_video_capture.release() 
+                    # Pipeline 3 tahap: capture (thread) -> inferensi (thread) -> UI + notifikasi (thread utama).
+                    # Antrian kecil (maxsize=2) menjaga latensi; frame dibuang saat backpressure.
+                    frame_queue = queue.Queue(maxsize=2)
+                    result_queue = queue.Queue(maxsize=2)
+                    stop_event = threading.Event()
+                    capture_thread = threading.Thread(
+                        target=_capture_worker,
+                        args=(cv_video_capture, frame_queue, stop_event, is_video_file_mode),
+                        daemon=True, name="detectorx-capture")
+                    inference_thread = threading.Thread(
+                        target=_inference_worker,
+                        args=(st.session_state.detector, frame_queue, result_queue, stop_event,
+                              conf_thresh_slider, iou_thresh_slider, imgsz_slider, augment_tta_checkbox,
+                              use_clahe_checkbox, batch_size_slider, motion_threshold_slider),
+                        daemon=True, name="detectorx-inference")
+                    capture_thread.start()
+                    inference_thread.start()
+
+                    stream_finished = False
+                    stream_frame_idx = 0
+                    while st.session_state.processing_active:
+                        try:
+                            pipeline_output = result_queue.get(timeout=0.2)
+                        except queue.Empty:
+                            if not inference_thread.is_alive():
+                                break
+                            continue
+                        if pipeline_output is None:  # Sentinel dari inference worker
+                            stream_finished = True
+                            break
+                        detected_objects, annotated_frame_bgr_output = pipeline_output
+                        # Throttle update widget: tampilan tiap 2 frame, log tiap
+                        # 5 frame (atau segera saat komposisi deteksi berubah).
+                        handle_detection_output(
+                            detected_objects, annotated_frame_bgr_output,
+                            frame_placeholder, notif_cooldown_slider,
+                            st.session_state.enable_telegram_notif, st.session_state.enable_whatsapp_notif,
+                            detection_log_area,
+                            render_display=(stream_frame_idx % 2 == 0),
+                            render_log_hint=(stream_frame_idx % 5 == 0))
+                        stream_frame_idx += 1
+
+                    stop_event.set()
+                    capture_thread.join(timeout=2.0)
+                    inference_thread.join(timeout=2.0)
+                    cv_video_capture.release()
                     if temp_video_file_path and os.path.exists(temp_video_file_path):
                         attempt_remove_temp_file(temp_video_file_path, max_retries=5, delay=0.2)
-                    if not st.session_state.processing_active and 'ret_val' in locals() and ret_val : detection_log_area.info("ℹ️ Pemrosesan dihentikan.")
-                    elif st.session_state.processing_active and 'ret_val' in locals() and not ret_val: 
-                         st.session_state.processing_active = False
-                         detection_log_area.success(f"✅ {'Video selesai.' if is_video_file_mode else 'Stream kamera berakhir.'}")
+                    if stream_finished:
+                        st.session_state.processing_active = False
+                        detection_log_area.success(f"✅ {'Video selesai.' if is_video_file_mode else 'Stream kamera berakhir.'}")
+                    elif not st.session_state.processing_active:
+                        detection_log_area.info("ℹ️ Pemrosesan dihentikan.")
 
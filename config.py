@@ -0,0 +1,31 @@
+# config.py
+import os
+import logging
+from functools import lru_cache
+from types import SimpleNamespace
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+@lru_cache(maxsize=1)
+def _load() -> SimpleNamespace:
+    """
+    Membaca file .env SEKALI per proses dan mengikat seluruh variabel
+    lingkungan yang dipakai aplikasi ke satu namespace. Sebelumnya
+    notifier.py dan gemini_analyzer.py masing-masing memanggil load_dotenv()
+    saat import (parse .env dobel) lalu menebar os.getenv di mana-mana;
+    sekarang cukup pembacaan atribut dari CFG.
+    """
+    load_dotenv()
+    return SimpleNamespace(
+        GEMINI_API_KEY=os.getenv("GEMINI_API_KEY"),
+        TELEGRAM_BOT_TOKEN=os.getenv("TELEGRAM_BOT_TOKEN"),
+        TELEGRAM_CHAT_ID=os.getenv("TELEGRAM_CHAT_ID"),
+        CALLMEBOT_API_KEY=os.getenv("CALLMEBOT_API_KEY"),
+        RECEIVER_WHATSAPP_NUMBER=os.getenv("RECEIVER_WHATSAPP_NUMBER"),
+        IMGUR_CLIENT_ID=os.getenv("IMGUR_CLIENT_ID"),
+        # Opsional: daftar client-ID dipisah koma untuk rotasi saat rate limit.
+        IMGUR_CLIENT_IDS=os.getenv("IMGUR_CLIENT_IDS"),
+    )
+
+CFG = _load()
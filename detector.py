@@ -1,24 +1,132 @@
 # detector.py
+from typing import NamedTuple
+
 from ultralytics import YOLO
+import torch
 import cv2
 import logging
-import numpy as np 
+import os
+import numpy as np
+
+from utils import apply_clahe_bgr
 
 logger = logging.getLogger(__name__)
 
+class Detection(NamedTuple):
+    """
+    Satu deteksi fire/smoke. NamedTuple menggantikan dict per box: akses
+    atribut lebih cepat daripada lookup kunci string dan jejak memorinya
+    jauh lebih kecil saat frame padat deteksi.
+    """
+    cls: int
+    conf: float
+    box: tuple
+    label: str
+
 class YoloDetector:
     """
     Kelas untuk melakukan deteksi objek menggunakan model YOLO (Ultralytics).
     """
+    def _resolve_optimized_weights(self, model_path):
+        """
+        Mencari (atau membuat) artefak model yang sudah dioptimalkan di samping
+        file .pt: TensorRT engine untuk CUDA, OpenVINO IR untuk CPU.
+        Ekspor hanya dilakukan sekali; run berikutnya langsung memuat artefaknya.
+        Mengembalikan path yang harus dimuat (bisa tetap .pt jika ekspor gagal).
+        """
+        if not model_path.endswith('.pt'):
+            return model_path  # Pengguna sudah menunjuk artefak spesifik (engine/onnx/dll).
+
+        base = model_path[:-3]
+        engine_path = base + '.engine'
+        int8_engine_path = base + '.int8.engine'
+        openvino_dir = base + '_openvino_model'
+
+        if self.device.startswith('cuda'):
+            # Artefak INT8 (hasil export_int8) diprioritaskan jika diminta lewat env.
+            if os.getenv('DETECTORX_PRECISION', '').lower() == 'int8' and os.path.exists(int8_engine_path):
+                logger.info(f"Menggunakan TensorRT engine INT8: {int8_engine_path}")
+                return int8_engine_path
+            if os.path.exists(engine_path):
+                logger.info(f"Menggunakan TensorRT engine yang sudah ada: {engine_path}")
+                return engine_path
+            try:
+                logger.info(f"Mengekspor '{model_path}' ke TensorRT engine (sekali saja, bisa beberapa menit)...")
+                YOLO(model_path).export(format='engine', half=True, imgsz=640, device=self.device)
+                if os.path.exists(engine_path):
+                    return engine_path
+            except Exception as e_exp:
+                logger.warning(f"Ekspor TensorRT gagal: {e_exp}. Tetap menggunakan '{model_path}'.")
+        else:
+            if os.path.isdir(openvino_dir):
+                logger.info(f"Menggunakan model OpenVINO yang sudah ada: {openvino_dir}")
+                return openvino_dir
+            try:
+                logger.info(f"Mengekspor '{model_path}' ke OpenVINO IR (sekali saja)...")
+                YOLO(model_path).export(format='openvino', imgsz=640)
+                if os.path.isdir(openvino_dir):
+                    return openvino_dir
+            except Exception as e_exp:
+                logger.warning(f"Ekspor OpenVINO gagal: {e_exp}. Tetap menggunakan '{model_path}'.")
+        return model_path
+
+    def export_int8(self, calib_data, model_path='best.pt', imgsz=640):
+        """
+        Mengekspor bobot .pt ke TensorRT engine INT8 dengan kalibrasi PTQ.
+        INT8 memberi lompatan throughput besar di perangkat edge (Jetson/NPU)
+        dibanding FP16. Hasil ekspor disimpan sebagai '<nama>.int8.engine'
+        di samping bobot dan otomatis dipakai jika DETECTORX_PRECISION=int8.
+        Args:
+            calib_data (str): Path dataset YAML berisi 100-300 frame
+                              representatif api/asap untuk kalibrasi.
+            model_path (str): Path bobot .pt sumber ekspor.
+            imgsz (int): Ukuran input model untuk engine.
+        Returns:
+            str | None: Path engine INT8 hasil ekspor, atau None jika gagal.
+        """
+        int8_engine_path = model_path[:-3] + '.int8.engine'
+        try:
+            logger.info(f"Mengekspor '{model_path}' ke TensorRT engine INT8 (kalibrasi: {calib_data})...")
+            exported = YOLO(model_path).export(format='engine', int8=True, data=calib_data,
+                                               imgsz=imgsz, device=self.device)
+            default_engine = model_path[:-3] + '.engine'
+            if exported and os.path.exists(str(exported)) and str(exported) != int8_engine_path:
+                os.replace(str(exported), int8_engine_path)
+            elif os.path.exists(default_engine):
+                os.replace(default_engine, int8_engine_path)
+            logger.info(f"Engine INT8 tersimpan di: {int8_engine_path}")
+            return int8_engine_path if os.path.exists(int8_engine_path) else None
+        except Exception as e_int8:
+            logger.error(f"Ekspor INT8 gagal: {e_int8}", exc_info=True)
+            return None
+
     def __init__(self, model_path='best.pt'):
         """
         Inisialisasi detektor.
         Args:
-            model_path (str): Path menuju file model .pt YOLO.
+            model_path (str): Path menuju file model .pt YOLO (atau artefak
+                              terekspor seperti .engine / folder OpenVINO).
         """
         try:
-            self.model = YOLO(model_path)
-            self.class_names = self.model.names 
+            # Pilih device sekali di awal; bisa dipaksa lewat env var DETECTORX_DEVICE
+            # (misalnya 'cpu' atau 'cuda:0'). FP16 hanya aktif di CUDA.
+            self.device = os.getenv('DETECTORX_DEVICE') or ('cuda' if torch.cuda.is_available() else 'cpu')
+            self.half = self.device.startswith('cuda')
+
+            load_path = self._resolve_optimized_weights(model_path)
+            self.model = YOLO(load_path)
+            self.is_exported = not load_path.endswith('.pt')
+            if not self.is_exported:
+                # .to()/.fuse() hanya berlaku untuk bobot PyTorch mentah.
+                try:
+                    self.model.to(self.device)
+                    if self.half:
+                        self.model.fuse()
+                    logger.info(f"Model YOLO berjalan di device '{self.device}' (half={self.half}).")
+                except Exception as e_dev:
+                    logger.warning(f"Gagal memindahkan model ke device '{self.device}': {e_dev}. Kembali ke CPU/FP32.")
+                    self.device, self.half = 'cpu', False
+            self.class_names = self.model.names
             if not self.class_names or not isinstance(self.class_names, dict) or not all(isinstance(k, int) for k in self.class_names.keys()):
                 logger.warning(f"Nama kelas dari model.names tidak valid atau bukan dictionary yang diharapkan (menerima: {self.class_names}).")
                 # !!! PENTING: SESUAIKAN ID KELAS DAN NAMA DI BAWAH INI JIKA PERLU !!!
@@ -30,9 +138,51 @@ class YoloDetector:
         except Exception as e:
             logger.error(f"Gagal memuat model YOLO dari '{model_path}': {e}", exc_info=True)
             self.model = None
-            self.class_names = {} 
+            self.class_names = {}
+            self.device, self.half = 'cpu', False
+        # ID kelas pemicu notifikasi dihitung sekali di sini, sehingga filter
+        # per-box di detect() cukup membandingkan integer tanpa .lower() per deteksi.
+        self.alert_class_ids = {cid for cid, name in self.class_names.items()
+                                if str(name).lower() in ('fire', 'smoke')}
+        self._alert_class_id_arr = np.array(sorted(self.alert_class_ids), dtype=np.int64)
+        # CLAHE CUDA: disiapkan sekali bila OpenCV terpasang dengan dukungan CUDA,
+        # lengkap dengan GpuMat yang dipakai ulang antar frame.
+        self._cuda_clahe = None
+        self._gpu_frame = None
+        try:
+            if hasattr(cv2, 'cuda') and cv2.cuda.getCudaEnabledDeviceCount() > 0:
+                self._cuda_clahe = cv2.cuda.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+                self._gpu_frame = cv2.cuda_GpuMat()
+                logger.info("CLAHE CUDA aktif: pra-pemrosesan akan berjalan di GPU.")
+        except Exception as e_cuda:
+            logger.debug(f"CLAHE CUDA tidak tersedia: {e_cuda}")
+            self._cuda_clahe = None
+
+    def preprocess(self, frame_bgr, use_clahe=False):
+        """
+        Pra-pemrosesan frame BGR sebelum deteksi. Saat CLAHE aktif dan OpenCV
+        punya dukungan CUDA, seluruh rantai upload->BGR2LAB->CLAHE(L)->LAB2BGR
+        berjalan di GPU dengan GpuMat yang dipakai ulang; selain itu jatuh ke
+        jalur CPU (utils.apply_clahe_bgr).
+        """
+        if not use_clahe:
+            return frame_bgr
+        if self._cuda_clahe is not None:
+            try:
+                self._gpu_frame.upload(frame_bgr)
+                gpu_lab = cv2.cuda.cvtColor(self._gpu_frame, cv2.COLOR_BGR2LAB)
+                l_ch, a_ch, b_ch = cv2.cuda.split(gpu_lab)
+                l_eq = self._cuda_clahe.apply(l_ch, cv2.cuda_Stream.Null())
+                cv2.cuda.merge((l_eq, a_ch, b_ch), gpu_lab)
+                gpu_bgr = cv2.cuda.cvtColor(gpu_lab, cv2.COLOR_LAB2BGR)
+                return gpu_bgr.download()
+            except cv2.error as e_gpu:
+                logger.warning(f"CLAHE CUDA gagal ({e_gpu}); beralih permanen ke jalur CPU.")
+                self._cuda_clahe = None
+        result = apply_clahe_bgr(frame_bgr)
+        return result if result is not None else frame_bgr
 
-    def detect(self, frame_input, confidence_threshold=0.25, iou_threshold=0.45, imgsz=640, augment=False):
+    def detect(self, frame_input, confidence_threshold=0.25, iou_threshold=0.45, imgsz=640, augment=False, return_arrays=False):
         """
         Melakukan deteksi objek pada frame gambar.
         Args:
@@ -41,96 +191,202 @@ class YoloDetector:
             iou_threshold (float): Ambang batas IoU untuk Non-Maximum Suppression.
             imgsz (int): Ukuran gambar input untuk model.
             augment (bool): Apakah menggunakan Test-Time Augmentation.
+            return_arrays (bool): Bila True, deteksi dikembalikan sebagai dict
+                array paralel {'cls','conf','box'} (structure-of-arrays) tanpa
+                membangun dictionary Python per box — caller streaming dapat
+                memfilternya secara vektor.
         Returns:
-            tuple: (detected_objects_list, annotated_frame)
-                   detected_objects_list (list): List berisi dictionary info deteksi yang relevan (fire/smoke).
+            tuple: (detected_objects, annotated_frame)
+                   detected_objects: list[Detection], atau dict of array
+                   bila return_arrays=True.
                    annotated_frame (np.ndarray): Frame BGR dengan anotasi (bounding box, label).
         """
         if self.model is None:
             logger.warning("Model YOLO tidak dimuat, proses deteksi dilewati.")
-            return [], frame_input 
+            return (self._empty_detection_arrays() if return_arrays else []), frame_input
 
         logger.debug(f"Frame input awal ke detect(): shape={frame_input.shape}, dtype={frame_input.dtype}")
 
-        processed_frame = frame_input 
-        if frame_input.ndim == 2: 
+        processed_frame = self._prepare_frame(frame_input)
+        if processed_frame is None:
+            return (self._empty_detection_arrays() if return_arrays else []), frame_input
+
+        logger.debug(f"Frame FINAL yang akan diinput ke model.predict: shape={processed_frame.shape}, dtype={processed_frame.dtype}")
+
+        results_list = self.model.predict(
+            source=processed_frame, 
+            conf=confidence_threshold, 
+            iou=iou_threshold,
+            imgsz=imgsz,
+            augment=augment,
+            device=self.device,
+            half=self.half,
+            verbose=False
+        )
+
+        if not results_list:
+            logger.info("Tidak ada hasil deteksi (results_list kosong) dari model predict.")
+            return (self._empty_detection_arrays() if return_arrays else []), processed_frame
+
+        return self._extract_results(results_list[0], processed_frame, confidence_threshold,
+                                     return_arrays=return_arrays)
+
+    def detect_batch(self, frames_input, confidence_threshold=0.25, iou_threshold=0.45, imgsz=640, augment=False, annotate=True):
+        """
+        Melakukan deteksi objek pada sekumpulan frame dalam SATU panggilan
+        model.predict. Untuk sumber video/kamera, batching mengamortisasi
+        overhead Python + peluncuran kernel per frame dibanding memanggil
+        detect() satu per satu.
+        Args:
+            frames_input (list[np.ndarray]): List frame gambar input.
+            (parameter lain sama dengan detect())
+        Returns:
+            list[tuple]: List (detected_objects_list, annotated_frame) dengan
+                         urutan sama seperti frames_input.
+        """
+        if self.model is None:
+            logger.warning("Model YOLO tidak dimuat, proses deteksi batch dilewati.")
+            return [([], frame) for frame in frames_input]
+        if not frames_input:
+            return []
+
+        prepared_frames = []
+        for frame in frames_input:
+            prepared = self._prepare_frame(frame)
+            prepared_frames.append(prepared if prepared is not None else frame)
+
+        try:
+            results_list = self.model.predict(
+                source=prepared_frames,
+                conf=confidence_threshold,
+                iou=iou_threshold,
+                imgsz=imgsz,
+                augment=augment,
+                device=self.device,
+                half=self.half,
+                verbose=False
+            )
+        except Exception as e:
+            logger.error(f"Error saat prediksi batch YOLO: {e}", exc_info=True)
+            return [([], frame) for frame in prepared_frames]
+
+        outputs = []
+        for processed_frame, results in zip(prepared_frames, results_list):
+            outputs.append(self._extract_results(results, processed_frame, confidence_threshold, annotate=annotate))
+        # Jika model mengembalikan lebih sedikit hasil dari jumlah frame (seharusnya tidak), lengkapi.
+        for leftover_frame in prepared_frames[len(outputs):]:
+            outputs.append(([], leftover_frame))
+        return outputs
+
+    def _prepare_frame(self, frame_input):
+        """
+        Menyamakan format frame input menjadi BGR 3 channel untuk model.
+        Mengembalikan None jika format tidak didukung.
+        """
+        processed_frame = frame_input
+        if frame_input.ndim == 2:
             logger.info("Input frame adalah grayscale. Mengkonversi ke BGR (3 channel)...")
             processed_frame = cv2.cvtColor(frame_input, cv2.COLOR_GRAY2BGR)
         elif frame_input.ndim == 3:
-            if frame_input.shape[2] == 4: 
+            if frame_input.shape[2] == 4:
                 logger.info("Input frame memiliki 4 channel (misalnya BGRA). Mengkonversi ke BGR (3 channel)...")
                 processed_frame = cv2.cvtColor(frame_input, cv2.COLOR_BGRA2BGR)
-            elif frame_input.shape[2] == 3: 
+            elif frame_input.shape[2] == 3:
                 logger.debug("Input frame sudah 3 channel (diasumsikan BGR/RGB). Tidak ada konversi channel yang dilakukan.")
             else:
-                logger.error(f"Input frame 3 dimensi memiliki jumlah channel tidak terduga: {frame_input.shape[2]}. Diharapkan 3 atau 4. Mengembalikan frame asli.")
-                return [], frame_input
+                logger.error(f"Input frame 3 dimensi memiliki jumlah channel tidak terduga: {frame_input.shape[2]}. Diharapkan 3 atau 4.")
+                return None
         else:
-            logger.error(f"Format dimensi input frame tidak didukung (ndim={frame_input.ndim}). Diharapkan 2 atau 3. Mengembalikan frame asli.")
-            return [], frame_input
+            logger.error(f"Format dimensi input frame tidak didukung (ndim={frame_input.ndim}). Diharapkan 2 atau 3.")
+            return None
 
         if not (processed_frame.ndim == 3 and processed_frame.shape[2] == 3):
-            logger.error(f"Setelah upaya konversi, frame masih bukan 3 channel BGR. Shape akhir: {processed_frame.shape}. Menghentikan deteksi untuk frame ini.")
-            return [], frame_input 
-        
-        logger.debug(f"Frame FINAL yang akan diinput ke model.predict: shape={processed_frame.shape}, dtype={processed_frame.dtype}")
+            logger.error(f"Setelah upaya konversi, frame masih bukan 3 channel BGR. Shape akhir: {processed_frame.shape}.")
+            return None
+        return processed_frame
 
-        results_list = self.model.predict(
-            source=processed_frame, 
-            conf=confidence_threshold, 
-            iou=iou_threshold,
-            imgsz=imgsz,
-            augment=augment,
-            verbose=False 
-        )
+    @staticmethod
+    def _empty_detection_arrays():
+        """Dict SoA kosong, bentuk yang sama dengan hasil return_arrays=True."""
+        return {'cls': np.empty(0, dtype=np.int32),
+                'conf': np.empty(0, dtype=np.float32),
+                'box': np.empty((0, 4), dtype=np.int32)}
 
+    def _extract_results(self, results, processed_frame, confidence_threshold, annotate=True,
+                         return_arrays=False):
+        """
+        Mengekstrak objek 'fire'/'smoke' dan frame beranotasi dari satu
+        objek Results Ultralytics. Dengan annotate=False, results.plot()
+        dilewati sepenuhnya (caller menggambar anotasi sendiri, misalnya pada
+        frame resolusi penuh). Dengan return_arrays=True, deteksi dikembalikan
+        sebagai dict array paralel (lihat detect()).
+        """
         detected_objects_list = []
-        annotated_frame = processed_frame.copy() 
+        detections_soa = self._empty_detection_arrays() if return_arrays else None
+        num_alert_objects = 0
+        annotated_frame = processed_frame
 
-        if not results_list:
-            logger.info("Tidak ada hasil deteksi (results_list kosong) dari model predict.")
-            return [], annotated_frame 
-        
         try:
-            results = results_list[0] 
-            annotated_frame_with_plots = results.plot() 
-            if annotated_frame_with_plots is not None and annotated_frame_with_plots.shape == annotated_frame.shape:
-                 annotated_frame = annotated_frame_with_plots 
-            elif annotated_frame_with_plots is not None:
-                 logger.warning(f"Hasil dari results.plot() memiliki shape berbeda ({annotated_frame_with_plots.shape}) dari frame input ({annotated_frame.shape}). Menggunakan frame sebelum plot.")
+            # results.plot() menyalin seluruh frame; untuk frame tanpa deteksi
+            # (mayoritas pada stream monitoring) cukup pakai frame aslinya.
+            if not annotate or len(results.boxes) == 0:
+                annotated_frame = processed_frame
             else:
-                logger.warning("Hasil dari results.plot() adalah None. Menggunakan frame sebelum plot.")
-
-            if logger.isEnabledFor(logging.DEBUG): # Hanya log detail jika level DEBUG aktif
-                logger.debug(f"--- Hasil Mentah dari Model Predict (conf_model={confidence_threshold}) ---")
-                if len(results.boxes) == 0:
-                    logger.debug("Tidak ada kotak deteksi sama sekali dari model.predict().")
-                for i, box in enumerate(results.boxes):
-                    class_id_raw = int(box.cls[0])
-                    conf_raw = float(box.conf[0])
-                    label_raw = self.class_names.get(class_id_raw, f"UnknownID_{class_id_raw}")
-                    logger.debug(f"  Mentah {i+1}: Label='{label_raw}' (ID:{class_id_raw}), Confidence={conf_raw:.4f}, Bbox={box.xyxy[0].cpu().numpy().astype(int).tolist()}")
-                logger.debug("--- Akhir Hasil Mentah ---")
-            
-            for box in results.boxes: # Iterasi lagi untuk memfilter fire/smoke
-                class_id_raw = int(box.cls[0])
-                conf_raw = float(box.conf[0])
-                label_raw = self.class_names.get(class_id_raw, f"UnknownID_{class_id_raw}")
-                if label_raw.lower() in ['fire', 'smoke']: # Filter utama di sini
-                    detected_objects_list.append({
-                        'label': label_raw,
-                        'confidence': conf_raw,
-                        'bbox': box.xyxy[0].cpu().numpy().astype(int).tolist()
-                    })
-            
-            if not detected_objects_list and len(results.boxes) > 0:
+                annotated_frame_with_plots = results.plot()
+                if annotated_frame_with_plots is not None and annotated_frame_with_plots.shape == processed_frame.shape:
+                    annotated_frame = annotated_frame_with_plots
+                elif annotated_frame_with_plots is not None:
+                    logger.warning(f"Hasil dari results.plot() memiliki shape berbeda ({annotated_frame_with_plots.shape}) dari frame input ({processed_frame.shape}). Menggunakan frame sebelum plot.")
+                else:
+                    logger.warning("Hasil dari results.plot() adalah None. Menggunakan frame sebelum plot.")
+
+            num_boxes = len(results.boxes)
+            if num_boxes > 0:
+                # Tiga transfer massal GPU->CPU, bukan tiga sinkronisasi device
+                # per box seperti pada iterasi box.cls[0]/box.conf[0]/box.xyxy[0].
+                boxes = results.boxes
+                cls_arr = boxes.cls.to('cpu', non_blocking=True).int().numpy()
+                conf_arr = boxes.conf.to('cpu', non_blocking=True).float().numpy()
+                xyxy_arr = boxes.xyxy.to('cpu', non_blocking=True).int().numpy()
+
+                if logger.isEnabledFor(logging.DEBUG): # Hanya log detail jika level DEBUG aktif
+                    logger.debug(f"--- Hasil Mentah dari Model Predict (conf_model={confidence_threshold}) ---")
+                    for i in range(num_boxes):
+                        class_id_raw = int(cls_arr[i])
+                        label_raw = self.class_names.get(class_id_raw, f"UnknownID_{class_id_raw}")
+                        logger.debug(f"  Mentah {i+1}: Label='{label_raw}' (ID:{class_id_raw}), Confidence={conf_arr[i]:.4f}, Bbox={xyxy_arr[i].tolist()}")
+                    logger.debug("--- Akhir Hasil Mentah ---")
+
+                # Filter fire/smoke lewat mask vektor terhadap ID kelas yang
+                # sudah dihitung di __init__ (tanpa .lower() per box).
+                alert_mask = np.isin(cls_arr, self._alert_class_id_arr)
+                alert_indices = np.nonzero(alert_mask)[0]
+                num_alert_objects = int(alert_indices.size)
+                if return_arrays:
+                    # SoA: cukup tiga fancy-index, tanpa dict Python per box.
+                    detections_soa = {'cls': cls_arr[alert_indices],
+                                      'conf': conf_arr[alert_indices],
+                                      'box': xyxy_arr[alert_indices]}
+                else:
+                    for i in alert_indices:
+                        class_id_raw = int(cls_arr[i])
+                        detected_objects_list.append(Detection(
+                            cls=class_id_raw,
+                            conf=float(conf_arr[i]),
+                            box=tuple(xyxy_arr[i].tolist()),
+                            label=self.class_names.get(class_id_raw, f"UnknownID_{class_id_raw}")
+                        ))
+            elif logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Tidak ada kotak deteksi sama sekali dari model.predict().")
+
+            if num_alert_objects == 0 and len(results.boxes) > 0:
                 logger.info(f"Objek terdeteksi oleh model ({len(results.boxes)}), tapi setelah difilter label, tidak ada 'fire' atau 'smoke'.")
-            elif not detected_objects_list:
+            elif num_alert_objects == 0:
                  logger.info("Tidak ada objek 'fire' atau 'smoke' yang terdeteksi (atau tidak melewati ambang conf model).")
             else:
-                logger.info(f"Berhasil memfilter {len(detected_objects_list)} objek 'fire'/'smoke' dari hasil model.")
+                logger.info(f"Berhasil memfilter {num_alert_objects} objek 'fire'/'smoke' dari hasil model.")
 
         except Exception as e:
             logger.error(f"Error saat memproses hasil deteksi YOLO: {e}", exc_info=True)
 
-        return detected_objects_list, annotated_frame
\ No newline at end of file
+        return (detections_soa if return_arrays else detected_objects_list), annotated_frame
\ No newline at end of file
@@ -1,83 +1,114 @@
 import os
+import json
+import time
+import queue
 import logging
+import mimetypes
+import threading
+import concurrent.futures
 import google.generativeai as genai
-from dotenv import load_dotenv
-from PIL import Image
+
+from config import CFG
 
 # Inisialisasi logger untuk file ini
 logger = logging.getLogger(__name__)
 
-# Muat variabel lingkungan dari file .env
-load_dotenv()
-
 # --- BLOK KONFIGURASI GEMINI ---
 
 # Gunakan konstanta untuk nama model agar mudah diganti di masa mendatang.
 # 'gemini-1.5-flash-latest' adalah pilihan yang efisien untuk analisis gambar.
 GEMINI_MODEL_NAME = 'gemini-1.5-flash-latest'
 
-# Ambil API Key dari environment variable
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-
-# Variabel untuk menampung instance model yang sudah diinisialisasi
-gemini_model_vision = None
+# Ambil API Key dari config terpusat (parse .env sekali per proses).
+GEMINI_API_KEY = CFG.GEMINI_API_KEY
 
-# Lakukan konfigurasi hanya jika API Key tersedia
-if GEMINI_API_KEY:
-    try:
-        # Konfigurasi API Google
-        genai.configure(api_key=GEMINI_API_KEY)
-        
-        # Inisialisasi model Generatif
-        gemini_model_vision = genai.GenerativeModel(GEMINI_MODEL_NAME)
-        
-        logger.info(f"Model Gemini '{GEMINI_MODEL_NAME}' berhasil diinisialisasi.")
-        
-    except Exception as e:
-        # Tangani error jika inisialisasi gagal
-        logger.error(f"Gagal mengkonfigurasi atau memuat model Gemini: {e}", exc_info=True)
-        # Set API Key ke None agar fungsi analisis tidak akan dijalankan
-        GEMINI_API_KEY = None
-else:
+if not GEMINI_API_KEY:
     # Beri peringatan jika API Key tidak ditemukan
     logger.warning("GEMINI_API_KEY tidak ditemukan di file .env. Fungsi analisis Gemini AI tidak akan aktif.")
 
+# Inisialisasi model dibuat LAZY: genai.configure + GenerativeModel baru
+# dijalankan saat analisis pertama benar-benar diminta, bukan saat import.
+# Jalur yang tidak pernah memakai Gemini (CLI tanpa --gemini, worker lain)
+# jadi tidak membayar biaya konstruksi maupun memorinya.
+_model_lock = threading.Lock()
+_model_singleton = None
+_MODEL_FAILED = object()  # Sentinel: inisialisasi pernah gagal, jangan diulang.
+
+def _get_model():
+    """
+    Mengembalikan instance GenerativeModel (dibuat sekali, thread-safe),
+    atau None bila API Key tidak ada / inisialisasi pernah gagal.
+    """
+    global _model_singleton
+    if _model_singleton is not None:
+        return None if _model_singleton is _MODEL_FAILED else _model_singleton
+    with _model_lock:
+        if _model_singleton is None:
+            if not GEMINI_API_KEY:
+                _model_singleton = _MODEL_FAILED
+            else:
+                try:
+                    genai.configure(api_key=GEMINI_API_KEY)
+                    _model_singleton = genai.GenerativeModel(GEMINI_MODEL_NAME)
+                    logger.info(f"Model Gemini '{GEMINI_MODEL_NAME}' berhasil diinisialisasi.")
+                except Exception as e:
+                    logger.error(f"Gagal mengkonfigurasi atau memuat model Gemini: {e}", exc_info=True)
+                    _model_singleton = _MODEL_FAILED
+    return None if _model_singleton is _MODEL_FAILED else _model_singleton
+
 # --- FUNGSI UTAMA ---
 
-def analyze_image_with_gemini(image_path: str, prompt_text: str) -> str:
+def analyze_image_with_gemini(image_path: str, prompt_text: str, image_bytes: bytes = None) -> str:
     """
     Menganalisis gambar menggunakan model multimodal Gemini (Vision).
 
     Args:
-        image_path (str): Path lengkap ke file gambar yang akan dianalisis.
+        image_path (str): Path lengkap ke file gambar yang akan dianalisis
+                          (boleh None jika image_bytes diberikan).
         prompt_text (str): Teks prompt yang akan digunakan untuk memandu analisis.
+        image_bytes (bytes): Buffer gambar JPEG in-memory; jika diberikan,
+                             dipakai menggantikan pembacaan dari disk.
 
     Returns:
         str: Hasil analisis dari Gemini AI, atau pesan error/peringatan.
     """
-    # Validasi awal: Pastikan API Key dan model sudah siap
-    if not GEMINI_API_KEY or not gemini_model_vision:
-        logger.warning("Analisis Gemini tidak dapat dilanjutkan karena API Key atau Model tidak dikonfigurasi.")
+    # Validasi awal tunggal: _get_model() merangkum cek API Key + model dalam
+    # satu pemanggilan; setelah inisialisasi pertama ini hanya satu baca
+    # global + satu branch, bukan dua global os.getenv-backed seperti dulu.
+    model = _get_model()
+    if model is None:
+        logger.debug("Analisis Gemini dilewati: API Key atau Model tidak dikonfigurasi.")
         return "Analisis Gemini tidak tersedia."
 
-    # Validasi keberadaan file gambar
-    if not os.path.exists(image_path):
+    # Validasi keberadaan file gambar (hanya relevan untuk jalur path)
+    if image_bytes is None and not os.path.exists(image_path):
         logger.error(f"File gambar untuk analisis Gemini tidak ditemukan di path: {image_path}")
         return f"Analisis Gagal: File gambar tidak ditemukan di {image_path}"
 
-    img_pil = None
     try:
-        logger.info(f"Membuka gambar '{image_path}' untuk dianalisis oleh Gemini...")
-        
-        # Buka gambar menggunakan Pillow
-        img_pil = Image.open(image_path)
-        
+        # Kirim bytes gambar APA ADANYA sebagai part {'mime_type','data'}:
+        # tanpa decode PIL (untuk frame 1080p ~6 MB buffer piksel) dan tanpa
+        # re-encode internal SDK — gambar sudah berupa JPEG/PNG ter-encode.
+        if image_bytes is not None:
+            logger.info("Mengirim buffer gambar in-memory untuk dianalisis oleh Gemini...")
+            # Lapisan protobuf SDK hanya menerima bytes; memoryview/bytearray
+            # dari pool caller dibekukan dulu (pola yang sama dengan
+            # upload_image_once di notifier).
+            if not isinstance(image_bytes, bytes):
+                image_bytes = bytes(image_bytes)
+            image_part = {'mime_type': 'image/jpeg', 'data': image_bytes}
+        else:
+            logger.info(f"Membaca gambar '{image_path}' untuk dianalisis oleh Gemini...")
+            mime_type = mimetypes.guess_type(image_path)[0] or 'image/jpeg'
+            with open(image_path, 'rb') as image_file:
+                image_part = {'mime_type': mime_type, 'data': image_file.read()}
+
         # Kirim prompt (teks dan gambar) ke model Gemini
-        response = gemini_model_vision.generate_content([prompt_text, img_pil])
+        response = model.generate_content([prompt_text, image_part])
         
         # Ekstraksi hasil teks dari respons dengan aman
         if response.candidates and response.candidates[0].content and response.candidates[0].content.parts:
-            analysis_text = ''.join(part.text for part in response.candidates[0].content.parts if hasattr(part, 'text'))
+            analysis_text = ''.join(getattr(part, 'text', '') for part in response.candidates[0].content.parts)
         else:
             analysis_text = ""
 
@@ -100,12 +131,138 @@ def analyze_image_with_gemini(image_path: str, prompt_text: str) -> str:
     except Exception as e:
         logger.error(f"Terjadi error saat melakukan analisis dengan Gemini AI: {str(e)}", exc_info=True)
         return f"Error saat berkomunikasi dengan Gemini AI: {str(e)}"
-        
-    finally:
-        # Pastikan objek gambar Pillow ditutup untuk melepaskan memori
-        if img_pil and hasattr(img_pil, 'close'): 
+
+# --- MICRO-BATCHER ---
+
+class GeminiBatcher:
+    """
+    Menggabungkan beberapa permintaan analisis yang datang berdekatan
+    (deteksi beruntun pada api/asap) menjadi SATU panggilan Gemini multi-gambar.
+    Prefill prompt dan round-trip jaringan jadi teramortisasi antar frame,
+    alih-alih satu RTT penuh per frame.
+
+    Pemakaian: submit() mengembalikan Future; worker daemon menunggu maksimal
+    max_wait_ms untuk mengumpulkan hingga max_batch_size permintaan, lalu
+    menjalankan satu generate_content dan membagikan hasil per gambar ke
+    masing-masing Future. Batch berukuran 1 jatuh kembali ke jalur
+    analyze_image_with_gemini biasa.
+    """
+
+    def __init__(self, max_batch_size: int = 4, max_wait_ms: int = 500):
+        self._queue = queue.Queue()
+        self._max_batch_size = max_batch_size
+        self._max_wait_s = max_wait_ms / 1000.0
+        self._start_lock = threading.Lock()
+        self._worker = None
+
+    def submit(self, prompt_text: str, image_bytes: bytes) -> 'concurrent.futures.Future':
+        """Mengantrekan satu permintaan analisis; hasilnya lewat Future[str]."""
+        self._ensure_worker()
+        result_future = concurrent.futures.Future()
+        self._queue.put((prompt_text, image_bytes, result_future))
+        return result_future
+
+    def analyze(self, prompt_text: str, image_bytes: bytes, timeout: float = 90.0) -> str:
+        """Varian blocking dari submit() untuk caller sinkron."""
+        try:
+            return self.submit(prompt_text, image_bytes).result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            logger.error(f"Analisis Gemini (batch) melewati batas waktu {timeout} detik.")
+            return "Analisis Gemini tidak tersedia."
+
+    def _ensure_worker(self):
+        if self._worker is not None:
+            return
+        with self._start_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(
+                    target=self._run, daemon=True, name="gemini-batcher")
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self._max_wait_s
+            while len(batch) < self._max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
             try:
-                img_pil.close()
-                logger.debug(f"Objek PIL Image untuk '{image_path}' telah ditutup.")
-            except Exception as e_close:
-                logger.error(f"Gagal menutup objek PIL Image: {e_close}")
\ No newline at end of file
+                self._process_batch(batch)
+            except Exception as e_batch:
+                logger.error(f"Error tak tertangani di worker GeminiBatcher: {e_batch}", exc_info=True)
+                for _, _, pending_future in batch:
+                    if not pending_future.done():
+                        pending_future.set_result("Analisis Gemini tidak tersedia.")
+
+    def _process_batch(self, batch):
+        if len(batch) == 1:
+            prompt_text, image_bytes, result_future = batch[0]
+            result_future.set_result(
+                analyze_image_with_gemini(None, prompt_text, image_bytes=image_bytes))
+            return
+
+        model = _get_model()
+        if model is None:
+            for _, _, result_future in batch:
+                result_future.set_result("Analisis Gemini tidak tersedia.")
+            return
+
+        logger.info(f"Menganalisis {len(batch)} gambar dalam satu permintaan Gemini (micro-batch)...")
+        instruction_lines = [
+            f"Anda menerima {len(batch)} gambar deteksi, masing-masing dengan konteksnya sendiri. "
+            "Balas HANYA dengan array JSON berisi string analisis per gambar, "
+            "dengan urutan sama seperti urutan gambar."
+        ]
+        content_parts = []
+        for index, (prompt_text, image_bytes, _) in enumerate(batch, start=1):
+            instruction_lines.append(f"Konteks gambar {index}: {prompt_text}")
+            content_parts.append({'mime_type': 'image/jpeg', 'data': image_bytes})
+
+        try:
+            response = model.generate_content(["\n".join(instruction_lines)] + content_parts)
+            if response.candidates and response.candidates[0].content and response.candidates[0].content.parts:
+                combined_text = ''.join(
+                    getattr(part, 'text', '') for part in response.candidates[0].content.parts).strip()
+            else:
+                combined_text = ""
+        except Exception as e:
+            logger.error(f"Error saat analisis batch Gemini: {e}", exc_info=True)
+            combined_text = ""
+
+        per_image_analyses = self._parse_json_array(combined_text, len(batch))
+        if per_image_analyses is None:
+            # Tidak bisa dipecah per gambar: bagikan teks utuh (atau pesan gagal) ke semua.
+            fallback_text = combined_text.strip() or "Analisis Gemini AI tidak menghasilkan output yang diharapkan."
+            for _, _, result_future in batch:
+                result_future.set_result(fallback_text)
+            return
+        for (_, _, result_future), analysis_text in zip(batch, per_image_analyses):
+            result_future.set_result(str(analysis_text).strip())
+
+    @staticmethod
+    def _parse_json_array(text, expected_length):
+        """Mengurai respons JSON array; None jika format tidak sesuai."""
+        cleaned = text.strip()
+        if cleaned.startswith("```"):
+            cleaned = cleaned.strip('`')
+            if cleaned.startswith("json"):
+                cleaned = cleaned[4:]
+        try:
+            parsed = json.loads(cleaned)
+        except (ValueError, TypeError):
+            return None
+        if isinstance(parsed, list) and len(parsed) == expected_length:
+            return parsed
+        return None
+
+# Instance bersama: cukup satu worker batching per proses.
+gemini_batcher = GeminiBatcher()
+
+def analyze_image_with_gemini_batched(prompt_text: str, image_bytes: bytes, timeout: float = 90.0) -> str:
+    """Jalur analisis yang lewat micro-batcher; dipakai alur notifikasi real-time."""
+    return gemini_batcher.analyze(prompt_text, image_bytes, timeout=timeout)
\ No newline at end of file
@@ -1,154 +1,391 @@
 # notifier.py
 import requests
 import os
-from dotenv import load_dotenv
-from imgurpython import ImgurClient
-from imgurpython.helpers.error import ImgurClientError, ImgurClientRateLimitError 
+import collections
+import concurrent.futures
+import io
 import logging
-import urllib.parse 
+import re
+import threading
+import time
+from PIL import Image
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from config import CFG
 
 logger = logging.getLogger(__name__)
-load_dotenv() 
 
-TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
-TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
-CALLMEBOT_API_KEY = os.getenv('CALLMEBOT_API_KEY')
-RECEIVER_WHATSAPP_NUMBER = os.getenv("RECEIVER_WHATSAPP_NUMBER") 
-IMGUR_CLIENT_ID = os.getenv("IMGUR_CLIENT_ID")
+# Session bersama dengan keep-alive: tanpa ini setiap panggilan Telegram/
+# CallMeBot/Imgur membayar TCP + TLS handshake baru (100-300 ms ke
+# api.telegram.org). Retry otomatis hanya untuk 5xx transien — 429 sengaja
+# TIDAK di-retry di lapisan ini: rate limit Imgur ditangani eksplisit oleh
+# rotasi client-ID + circuit breaker di upload_to_imgur, dan retry urllib3
+# tersembunyi hanya membakar kuota ID yang sama plus backoff berdetik-detik
+# sebelum lapisan itu sempat bereaksi.
+_http = requests.Session()
+_http_adapter = HTTPAdapter(
+    pool_connections=4, pool_maxsize=16,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[500, 502, 503, 504],
+                      raise_on_status=False))
+_http.mount('https://', _http_adapter)
+_http.mount('http://', _http_adapter)
+
+# Seluruh kredensial diambil dari config.py (parse .env sekali per proses).
+TELEGRAM_BOT_TOKEN = CFG.TELEGRAM_BOT_TOKEN
+TELEGRAM_CHAT_ID = CFG.TELEGRAM_CHAT_ID
+CALLMEBOT_API_KEY = CFG.CALLMEBOT_API_KEY
+RECEIVER_WHATSAPP_NUMBER = CFG.RECEIVER_WHATSAPP_NUMBER
+IMGUR_CLIENT_ID = CFG.IMGUR_CLIENT_ID
+
+IMGUR_UPLOAD_URL = "https://api.imgur.com/3/image"
+CALLMEBOT_WHATSAPP_URL = "https://api.callmebot.com/whatsapp.php"
+_WHATSAPP_MAX_TEXT_CHARS = 3000
+# Untuk pratinjau Telegram/WhatsApp gambar tidak perlu >1280px; frame anotasi
+# 1080p/4K bisa beberapa MB, padahal jalur ini dibatasi bandwidth unggah.
+_UPLOAD_MAX_DIMENSION = 1280
+_UPLOAD_SHRINK_THRESHOLD_BYTES = 300_000
 
-imgur_client_notifier = None
-if IMGUR_CLIENT_ID:
+def _shrink_image_for_upload(image_path=None, image_bytes=None):
+    """
+    Memperkecil gambar ke maksimal 1280px sisi terpanjang dan re-encode JPEG
+    quality 80 sebelum diunggah. Mengembalikan bytes hasil, atau None jika
+    gagal (caller memakai gambar asli).
+    """
     try:
-        imgur_client_notifier = ImgurClient(IMGUR_CLIENT_ID, None) 
-        logger.info("Klien Imgur untuk notifier.py berhasil diinisialisasi.")
+        source = io.BytesIO(image_bytes) if image_bytes is not None else image_path
+        with Image.open(source) as img:
+            img.thumbnail((_UPLOAD_MAX_DIMENSION, _UPLOAD_MAX_DIMENSION), Image.Resampling.LANCZOS)
+            out_buffer = io.BytesIO()
+            img.convert('RGB').save(out_buffer, 'JPEG', quality=80, optimize=True)
+        return out_buffer.getvalue()
     except Exception as e:
-        logger.error(f"Gagal menginisialisasi klien Imgur: {e}")
-else:
+        logger.warning(f"Gagal memperkecil gambar sebelum unggah Imgur ({e}); memakai gambar asli.")
+        return None
+
+# Pool client-ID Imgur untuk rotasi: IMGUR_CLIENT_IDS (dipisah koma) melipat-
+# gandakan kapasitas unggah harian — saat satu ID kena 429, ID berikutnya
+# dicoba. Tanpa IMGUR_CLIENT_IDS, pool berisi satu ID dari IMGUR_CLIENT_ID.
+_imgur_client_pool = collections.deque(
+    client_id.strip()
+    for client_id in (CFG.IMGUR_CLIENT_IDS or IMGUR_CLIENT_ID or '').split(',')
+    if client_id.strip())
+
+if not _imgur_client_pool:
     logger.warning("IMGUR_CLIENT_ID tidak ditemukan di .env. Fungsi unggah ke Imgur tidak akan aktif.")
+elif len(_imgur_client_pool) > 1:
+    logger.info(f"Pool client-ID Imgur aktif dengan {len(_imgur_client_pool)} ID (rotasi saat rate limit).")
+
+# Circuit breaker Imgur: begitu kena rate limit (429 / kredit user habis),
+# unggahan berikutnya di-short-circuit tanpa HTTP sama sekali selama satu jam,
+# alih-alih terus membakar kredit dan menambah latensi per alert.
+_IMGUR_BREAK_DURATION_S = 3600.0
+_imgur_breaker_lock = threading.Lock()
+_imgur_open_until = 0.0
 
-def upload_to_imgur(image_path):
-    """Mengunggah gambar ke Imgur dan mengembalikan URL publiknya."""
-    if not imgur_client_notifier:
+def _imgur_breaker_is_open():
+    return time.monotonic() < _imgur_open_until
+
+def _trip_imgur_breaker():
+    global _imgur_open_until
+    with _imgur_breaker_lock:
+        _imgur_open_until = time.monotonic() + _IMGUR_BREAK_DURATION_S
+    logger.warning(f"Circuit breaker Imgur AKTIF: unggahan dilewati selama "
+                   f"{_IMGUR_BREAK_DURATION_S / 60:.0f} menit ke depan.")
+
+def upload_to_imgur(image_path=None, image_bytes=None):
+    """
+    Mengunggah gambar ke Imgur dan mengembalikan URL publiknya.
+    Menerima path file ATAU buffer bytes JPEG di memori (image_bytes).
+    Unggahan memakai multipart/form-data biner langsung ke API Imgur — tanpa
+    imgurpython, yang membaca seluruh file lalu meng-encode base64 (~1.33x
+    ukuran asli di jaringan plus satu salinan penuh di memori).
+    """
+    if not _imgur_client_pool:
         logger.warning("Klien Imgur tidak aktif atau tidak terkonfigurasi, unggahan dilewati.")
         return None
-    if not os.path.exists(image_path):
+    if _imgur_breaker_is_open():
+        logger.info("Circuit breaker Imgur masih terbuka; unggahan dilewati tanpa panggilan HTTP.")
+        return None
+    if image_bytes is None and (not image_path or not os.path.exists(image_path)):
         logger.error(f"File gambar untuk diunggah ke Imgur tidak ditemukan: {image_path}")
         return None
+
+    # Perkecil dulu gambar besar; gambar kecil dilewatkan apa adanya agar
+    # tidak membayar decode+re-encode yang tidak perlu.
     try:
-        logger.info(f"Mengunggah file '{image_path}' ke Imgur...")
-        image_obj = imgur_client_notifier.upload_from_path(image_path, anon=True)
-        imgur_link = image_obj['link']
-        logger.info(f"Berhasil diunggah ke Imgur. Link: {imgur_link}")
-        return imgur_link
-    except ImgurClientRateLimitError as re: 
-        logger.error(f"Imgur API rate limit terlampaui: {re}", exc_info=True)
+        if image_bytes is not None and len(image_bytes) > _UPLOAD_SHRINK_THRESHOLD_BYTES:
+            shrunk_bytes = _shrink_image_for_upload(image_bytes=image_bytes)
+            if shrunk_bytes is not None:
+                logger.info(f"Gambar unggahan Imgur diperkecil: {len(image_bytes)} -> {len(shrunk_bytes)} bytes.")
+                image_bytes = shrunk_bytes
+        elif image_bytes is None and os.path.getsize(image_path) > _UPLOAD_SHRINK_THRESHOLD_BYTES:
+            shrunk_bytes = _shrink_image_for_upload(image_path=image_path)
+            if shrunk_bytes is not None:
+                logger.info(f"File unggahan Imgur diperkecil menjadi {len(shrunk_bytes)} bytes.")
+                image_bytes = shrunk_bytes
+    except OSError as e_size:
+        logger.warning(f"Gagal memeriksa ukuran '{image_path}' sebelum unggah: {e_size}")
+
+    try:
+        # Coba setiap client-ID di pool; rotasi saat 429 sampai pool habis.
+        max_attempts = len(_imgur_client_pool)
+        for attempt in range(max_attempts):
+            headers = {'Authorization': f'Client-ID {_imgur_client_pool[0]}'}
+            if image_bytes is not None:
+                logger.info("Mengunggah buffer gambar in-memory ke Imgur...")
+                files = {'image': ('frame.jpg', image_bytes, 'image/jpeg')}
+                response = _http.post(IMGUR_UPLOAD_URL, files=files, headers=headers, timeout=30)
+            else:
+                logger.info(f"Mengunggah file '{image_path}' ke Imgur...")
+                with open(image_path, 'rb') as image_file:
+                    # File object diberikan langsung agar requests men-stream isinya.
+                    files = {'image': ('frame.jpg', image_file, 'image/jpeg')}
+                    response = _http.post(IMGUR_UPLOAD_URL, files=files, headers=headers, timeout=30)
+
+            remaining_user = response.headers.get('X-RateLimit-UserRemaining')
+            if response.status_code == 429:
+                remaining_client = response.headers.get('X-RateLimit-ClientRemaining')
+                logger.error(f"Imgur API rate limit terlampaui (429) pada client-ID ke-{attempt + 1}. "
+                             f"Sisa kredit user/klien: {remaining_user}/{remaining_client}")
+                if attempt < max_attempts - 1:
+                    _imgur_client_pool.rotate(-1)  # ID berikutnya di depan
+                    continue
+                # Seluruh pool kena limit: buka breaker agar alert berikutnya
+                # tidak menghambur-hamburkan round-trip.
+                _trip_imgur_breaker()
+                return None
+            if remaining_user == '0' and max_attempts == 1:
+                # Unggahan ini masih lolos, tapi kredit user sudah habis dan
+                # tidak ada ID cadangan: buka breaker sebelum 429 pertama.
+                _trip_imgur_breaker()
+            response.raise_for_status()
+
+            imgur_link = response.json()['data']['link']
+            logger.info(f"Berhasil diunggah ke Imgur. Link: {imgur_link}")
+            return imgur_link
+    except requests.exceptions.RequestException as e:
+        logger.error("Error HTTP saat mengunggah '%s' ke Imgur: %s", image_path, e, exc_info=True)
+        # .text men-decode seluruh body respons; hanya lakukan bila levelnya lolos.
+        if hasattr(e, 'response') and e.response is not None and logger.isEnabledFor(logging.ERROR):
+            logger.error("Respons API Imgur: Status %s, Isi: %s", e.response.status_code, e.response.text[:300])
         return None
-    except ImgurClientError as ice: 
-        logger.error(f"Error dari Imgur API (ImgurClientError) saat unggah '{image_path}': {ice}", exc_info=True)
-        if hasattr(ice, 'status_code') and hasattr(ice, 'error_message'):
-            logger.error(f"Detail Error Imgur: Status {ice.status_code}, Pesan: {ice.error_message}")
+    except (KeyError, ValueError) as e_parse:
+        logger.error(f"Respons Imgur tidak berformat seperti yang diharapkan: {e_parse}", exc_info=True)
         return None
-    except Exception as e: 
+    except Exception as e:
         logger.error(f"Error tidak terduga saat mengunggah '{image_path}' ke Imgur: {e}", exc_info=True)
         return None
 
-def format_rich_notification_message(message_details: dict, imgur_link_for_message: str = None):
+# Cache LRU manual (bukan functools.lru_cache) karena HANYA link sukses yang
+# boleh disimpan: memoisasi hasil None akan mematri kegagalan sementara
+# (breaker Imgur terbuka, error jaringan) sehingga retry kunci yang sama
+# tidak pernah bisa berhasil lagi.
+_UPLOAD_CACHE_MAX = 16
+_upload_link_cache = collections.OrderedDict()
+
+def _upload_cached(cache_key, **upload_kwargs):
+    imgur_link = _upload_link_cache.get(cache_key)
+    if imgur_link is not None:
+        _upload_link_cache.move_to_end(cache_key)
+        return imgur_link
+    imgur_link = upload_to_imgur(**upload_kwargs)
+    if imgur_link is not None:
+        _upload_link_cache[cache_key] = imgur_link
+        if len(_upload_link_cache) > _UPLOAD_CACHE_MAX:
+            _upload_link_cache.popitem(last=False)
+    return imgur_link
+
+def _upload_bytes_cached(image_bytes):
+    """Cache untuk buffer identik (burst deteksi pada frame yang sama)."""
+    return _upload_cached(image_bytes, image_bytes=image_bytes)
+
+def _upload_path_cached(image_path, mtime_ns, size):
+    """Kunci cache menyertakan mtime+size agar file yang ditimpa di-upload ulang."""
+    return _upload_cached((image_path, mtime_ns, size), image_path=image_path)
+
+def upload_image_once(image_path=None, image_bytes=None):
     """
-    Mempersiapkan teks pesan notifikasi agar sesuai dengan format yang diinginkan pengguna.
-    Contoh: "LIVE ALERT! Terdeteksi Fire di Hutan dan lahan dari Unggahan Video: namafile.mp4"
+    Titik unggah Imgur bersama untuk semua kanal notifikasi. Satu event deteksi
+    cukup satu unggahan; Telegram dan WhatsApp memakai link yang sama, sehingga
+    konsumsi kredit API Imgur per alert terpangkas setengah (limit harian
+    Imgur keras: 1.250 unggahan/hari).
+    """
+    if image_bytes is not None:
+        # Buffer bytes-like (memoryview/bytearray dari pool caller) dibekukan
+        # jadi bytes: kunci lru_cache harus immutable dan hashable.
+        if not isinstance(image_bytes, bytes):
+            image_bytes = bytes(image_bytes)
+        return _upload_bytes_cached(image_bytes)
+    if image_path:
+        # Satu os.stat merangkap cek keberadaan sekaligus kunci cache.
+        try:
+            stat_result = os.stat(image_path)
+        except OSError as e:
+            logger.error(f"Gagal membaca stat file '{image_path}' untuk unggah Imgur: {e}")
+            return None
+        return _upload_path_cached(image_path, stat_result.st_mtime_ns, stat_result.st_size)
+    return None
+
+# Respons "gagal" dari gemini_analyzer yang tidak layak ditampilkan di pesan.
+# frozenset di level modul: lookup O(1) tanpa membangun list baru per panggilan.
+_GEMINI_SKIP = frozenset({
+    "analisis gemini tidak tersedia.",
+    "file gambar tidak ditemukan untuk analisis.",
+    "analisis gemini tidak menghasilkan output yang diharapkan.",
+    "analisis gemini diblokir.",
+})
+
+# Karakter yang wajib di-escape pada MarkdownV2 Telegram. Meloloskan teks
+# sekali di muka (regex C) jauh lebih murah daripada membiarkan Telegram
+# menolak pesan (400) lalu mengulang seluruh HTTP POST lewat jalur fallback.
+_MD_ESCAPE = re.compile(r'([_*\[\]()~`>#+\-=|{}.!])')
+
+def _escape_markdown_v2(text: str) -> str:
+    """Meloloskan karakter khusus MarkdownV2 (teks Gemini bisa berisi apa saja)."""
+    return _MD_ESCAPE.sub(r'\\\1', text)
+
+# Kelas deteksi tertutup (fire/smoke): tabel judul siap pakai menggantikan
+# .capitalize() per panggilan; kelas tak dikenal tetap di-capitalize.
+_DET_TYPE_TITLES = {'fire': 'Fire', 'smoke': 'Smoke', 'Fire': 'Fire', 'Smoke': 'Smoke'}
+
+_GEMINI_HEADER_MARK = "\n\n— 🧠 Analisis & Saran Gemini AI —"
+
+def _build_base_message(message_details: dict) -> str:
     """
-    det_type = message_details.get('detection_type', 'Bahaya').capitalize()
+    Merakit bagian pesan yang SAMA untuk semua kanal (judul, detail, analisis
+    Gemini) — tanpa link gambar. Saat Telegram dan WhatsApp sama-sama aktif,
+    bagian ini cukup dihitung sekali per event deteksi.
+    """
+    det_type_raw = message_details.get('detection_type', 'Bahaya')
+    det_type = _DET_TYPE_TITLES.get(det_type_raw) or det_type_raw.capitalize()
     location = message_details.get('location', 'Lokasi Tidak Diketahui')
     source_info = message_details.get('source_info', 'sumber tidak diketahui')
     confidence = message_details.get('confidence', 0.0)
     timestamp = message_details.get('timestamp', 'Waktu Tidak Tercatat')
     gemini_text = message_details.get('gemini_analysis')
 
-    # 1. Membuat Judul Notifikasi
-    # Menggabungkan semua informasi ke dalam satu baris judul
-    title_line = f"🔥🚨 LIVE ALERT! Terdeteksi {det_type} di {location} dari {source_info}"
-
-    # 2. Membuat Detail Deteksi
-    # Menggunakan format desimal untuk kepercayaan dan menghapus emoji
-    confidence_text = f"Kepercayaan: {confidence:.2f}"
-    timestamp_text = f"Waktu Deteksi: {timestamp}"
-    detection_details_text = f"{confidence_text}\n{timestamp_text}"
+    parts = [
+        # 1. Judul notifikasi: semua informasi dalam satu baris
+        f"🔥🚨 LIVE ALERT! Terdeteksi {det_type} di {location} dari {source_info}",
+        # 2. Detail deteksi (kepercayaan desimal, tanpa emoji)
+        f"\nKepercayaan: {confidence:.2f}\nWaktu Deteksi: {timestamp}",
+    ]
 
-    # 3. Merakit pesan utama
-    full_message = f"{title_line}\n\n{detection_details_text}"
+    # 3. Analisis Gemini dengan header yang sesuai (opsional)
+    gemini_text_stripped = gemini_text.strip() if gemini_text else ""
+    if gemini_text_stripped and gemini_text_stripped.lower() not in _GEMINI_SKIP:
+        parts.append(f"\n— 🧠 Analisis & Saran Gemini AI —\n{gemini_text_stripped}")
 
-    # 4. Menambahkan link gambar dalam satu baris
-    if imgur_link_for_message:
-        full_message += f"\n\n🖼️ Frame Deteksi: {imgur_link_for_message}"
+    return "\n".join(parts).strip()
 
-    # 5. Menambahkan Analisis Gemini dengan header yang sesuai
-    if gemini_text and \
-       gemini_text.strip().lower() not in ["analisis gemini tidak tersedia.",
-                                           "file gambar tidak ditemukan untuk analisis.",
-                                           "analisis gemini tidak menghasilkan output yang diharapkan.",
-                                           "analisis gemini diblokir."]:
-        gemini_header = "\n\n— 🧠 Analisis & Saran Gemini AI —"
-        # Langsung gabungkan teks analisis dari Gemini
-        full_message += f"{gemini_header}\n{gemini_text.strip()}"
+def _append_image_link(base_message: str, imgur_link: str) -> str:
+    """
+    Menyisipkan baris link gambar per-kanal ke pesan dasar, tepat sebelum
+    seksi analisis Gemini agar tata letak pesan tetap seperti semula.
+    """
+    if not imgur_link:
+        return base_message
+    link_block = f"\n\n🖼️ Frame Deteksi: {imgur_link}"
+    header_idx = base_message.find(_GEMINI_HEADER_MARK)
+    if header_idx == -1:
+        return base_message + link_block
+    return f"{base_message[:header_idx]}{link_block}{base_message[header_idx:]}"
 
-    return full_message.strip()
+def format_rich_notification_message(message_details: dict, imgur_link_for_message: str = None):
+    """
+    Mempersiapkan teks pesan notifikasi agar sesuai dengan format yang diinginkan pengguna.
+    Contoh: "LIVE ALERT! Terdeteksi Fire di Hutan dan lahan dari Unggahan Video: namafile.mp4"
+    Kini hanya delegasi ke pasangan _build_base_message/_append_image_link;
+    caller yang mengirim ke banyak kanal sebaiknya memanggil keduanya langsung
+    agar pesan dasar tidak dihitung ulang.
+    """
+    return _append_image_link(_build_base_message(message_details), imgur_link_for_message)
 
 
-def send_telegram_notification(message_details: dict, image_path_annotated: str = None):
+def send_telegram_notification(message_details: dict, image_path_annotated: str = None, image_bytes: bytes = None,
+                               imgur_link: str = None, image_available: bool = None,
+                               base_message: str = None):
     """
     Mengirim notifikasi ke Telegram dengan gambar hasil deteksi (anotasi) dan detail lengkap.
+    Gambar bisa berupa path file (image_path_annotated) atau buffer JPEG
+    in-memory (image_bytes); jalur bytes tidak menyentuh disk sama sekali.
+    Jika imgur_link sudah diberikan oleh caller (unggahan bersama antar kanal),
+    tidak ada unggahan Imgur tambahan di sini.
     """
     if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHAT_ID:
         logger.error("Token Bot Telegram atau Chat ID tidak lengkap. Notifikasi Telegram dibatalkan.")
         return False
-    
-    imgur_link_tg = None
-    if image_path_annotated and os.path.exists(image_path_annotated):
-        imgur_link_tg = upload_to_imgur(image_path_annotated) 
+
+    if image_available is None:
+        image_available = image_bytes is not None or (image_path_annotated and os.path.exists(image_path_annotated))
+
+    imgur_link_tg = imgur_link
+    if imgur_link_tg is None and image_available:
+        imgur_link_tg = upload_image_once(image_path_annotated, image_bytes=image_bytes)
         if not imgur_link_tg:
             logger.warning("Telegram: Gagal unggah ke Imgur, link tidak akan disertakan di caption jika pengiriman file langsung juga gagal.")
 
-    full_caption_text = format_rich_notification_message(message_details, imgur_link_for_message=imgur_link_tg)
+    if base_message is None:
+        base_message = _build_base_message(message_details)
+    full_caption_text = _append_image_link(base_message, imgur_link_tg)
 
     try:
-        if image_path_annotated and os.path.exists(image_path_annotated):
-            logger.info(f"Telegram: Mencoba mengirim file gambar anotasi '{image_path_annotated}' langsung...")
+        if image_available:
             url_photo = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendPhoto"
-            with open(image_path_annotated, 'rb') as photo_file:
-                files = {'photo': photo_file}
-                data = {'chat_id': TELEGRAM_CHAT_ID, 'caption': full_caption_text, 'parse_mode': 'Markdown'}
-                response_photo = requests.post(url_photo, files=files, data=data, timeout=30) 
-                response_photo.raise_for_status() 
-            logger.info(f"Notifikasi gambar anotasi '{image_path_annotated}' dengan detail berhasil terkirim ke Telegram.")
+            data = {'chat_id': TELEGRAM_CHAT_ID, 'caption': _escape_markdown_v2(full_caption_text),
+                    'parse_mode': 'MarkdownV2'}
+            if imgur_link_tg:
+                # Gambar sudah ada di Imgur: sendPhoto menerima URL langsung,
+                # jadi unggahan multipart multi-ratus-KB ke Telegram dilewati
+                # dan Telegram mengambil gambarnya sendiri dari Imgur.
+                logger.info("Telegram: Mengirim gambar anotasi via link Imgur (tanpa unggah ulang)...")
+                data['photo'] = imgur_link_tg
+                response_photo = _http.post(url_photo, data=data, timeout=30)
+                response_photo.raise_for_status()
+            elif image_bytes is not None:
+                logger.info("Telegram: Mencoba mengirim gambar anotasi langsung...")
+                files = {'photo': ('detection.jpg', image_bytes, 'image/jpeg')}
+                response_photo = _http.post(url_photo, files=files, data=data, timeout=30)
+                response_photo.raise_for_status()
+            else:
+                with open(image_path_annotated, 'rb') as photo_file:
+                    files = {'photo': photo_file}
+                    response_photo = _http.post(url_photo, files=files, data=data, timeout=30)
+                    response_photo.raise_for_status()
+            logger.info("Notifikasi gambar anotasi dengan detail berhasil terkirim ke Telegram.")
             return True
-        else: 
+        else:
             final_text_to_send = full_caption_text
             if image_path_annotated:
                 logger.warning(f"Telegram: File gambar anotasi tidak ditemukan di '{image_path_annotated}'.")
-                final_text_to_send += "\n\n(Peringatan: Gambar deteksi tidak dapat disertakan.)" 
+                final_text_to_send += "\n\n(Peringatan: Gambar deteksi tidak dapat disertakan.)"
             else:
-                logger.info("Telegram: Tidak ada path gambar anotasi. Mengirim notifikasi teks saja.")
-            
+                logger.info("Telegram: Tidak ada gambar anotasi. Mengirim notifikasi teks saja.")
+
             url_msg_txt = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
-            payload_msg_txt = {'chat_id': TELEGRAM_CHAT_ID, 'text': final_text_to_send, 'parse_mode': 'Markdown'}
-            response_txt = requests.post(url_msg_txt, data=payload_msg_txt, timeout=10)
+            payload_msg_txt = {'chat_id': TELEGRAM_CHAT_ID, 'text': _escape_markdown_v2(final_text_to_send),
+                               'parse_mode': 'MarkdownV2'}
+            response_txt = _http.post(url_msg_txt, data=payload_msg_txt, timeout=10)
             response_txt.raise_for_status()
             logger.info("Notifikasi teks Telegram berhasil terkirim.")
             return True
-            
-    except requests.exceptions.RequestException as e: 
-        logger.error(f"Error saat mengirim notifikasi Telegram (upaya utama): {e}")
-        if hasattr(e, 'response') and e.response is not None: 
-            logger.error(f"Respons API Telegram: Status {e.response.status_code}, Isi: {e.response.text}")
+
+    except requests.exceptions.RequestException as e:
+        logger.error("Error saat mengirim notifikasi Telegram (upaya utama): %s", e)
+        # Gating isEnabledFor: e.response.text men-decode seluruh body.
+        if hasattr(e, 'response') and e.response is not None and logger.isEnabledFor(logging.ERROR):
+            logger.error("Respons API Telegram: Status %s, Isi: %s", e.response.status_code, e.response.text)
         try:
             logger.warning("Telegram: Upaya utama pengiriman notifikasi gagal, mencoba mengirim pesan teks lengkap sebagai fallback...")
             text_for_fallback = full_caption_text
-            if image_path_annotated and os.path.exists(image_path_annotated):
+            if image_available:
                  text_for_fallback += "\n\n(Peringatan: Gagal mengirim gambar deteksi secara langsung ke Telegram.)"
 
             url_msg_txt_fallback = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
-            payload_msg_txt_fallback = {'chat_id': TELEGRAM_CHAT_ID, 'text': text_for_fallback, 'parse_mode': 'Markdown'}
-            requests.post(url_msg_txt_fallback, data=payload_msg_txt_fallback, timeout=10).raise_for_status()
+            payload_msg_txt_fallback = {'chat_id': TELEGRAM_CHAT_ID, 'text': _escape_markdown_v2(text_for_fallback),
+                                        'parse_mode': 'MarkdownV2'}
+            _http.post(url_msg_txt_fallback, data=payload_msg_txt_fallback, timeout=10).raise_for_status()
             logger.info("Pesan teks fallback Telegram berhasil terkirim setelah kegagalan.")
             return True
         except Exception as ef:
@@ -158,50 +395,114 @@ def send_telegram_notification(message_details: dict, image_path_annotated: str
         logger.error(f"Error tidak terduga di send_telegram_notification: {e_gen}", exc_info=True)
         return False
 
-def send_whatsapp_notification(message_details: dict, image_path_annotated: str = None):
+# Executor kecil untuk fan-out notifikasi: Telegram dan WhatsApp masing-masing
+# butuh beberapa RTT HTTP; menjalankannya paralel memangkas latensi total dari
+# T_telegram + T_whatsapp menjadi max(T_telegram, T_whatsapp).
+_notify_executor = concurrent.futures.ThreadPoolExecutor(max_workers=4, thread_name_prefix="notifier")
+
+def send_all_notifications(message_details: dict, image_path_annotated: str = None, image_bytes: bytes = None,
+                           enable_telegram: bool = True, enable_whatsapp: bool = True):
+    """
+    Mengirim notifikasi Telegram dan WhatsApp secara BERSAMAAN (bukan
+    berurutan) dan menunggu keduanya selesai. Caller tetap sinkron; fan-out
+    terjadi lewat thread pool internal modul ini. Kanal yang dinonaktifkan
+    caller (enable_telegram/enable_whatsapp=False) dilewati seluruhnya.
+
+    Returns:
+        dict: {'telegram': bool, 'whatsapp': bool} status keberhasilan per
+              kanal yang diminta.
+    """
+    if not (enable_telegram or enable_whatsapp):
+        return {}
+    # Satu stat() untuk seluruh event: kedua kanal menerima bool siap pakai
+    # alih-alih mengulang os.path.exists pada path yang sama.
+    image_available = image_bytes is not None or bool(
+        image_path_annotated and os.path.exists(image_path_annotated))
+    # Unggah ke Imgur SEKALI di sini; kedua kanal memakai link yang sama.
+    shared_imgur_link = upload_image_once(image_path_annotated, image_bytes=image_bytes) if image_available else None
+    # Pesan dasar (judul+detail+Gemini) juga dihitung SEKALI untuk kedua kanal.
+    shared_base_message = _build_base_message(message_details)
+    pending = {}
+    if enable_telegram:
+        pending['telegram'] = _notify_executor.submit(
+            send_telegram_notification, message_details, image_path_annotated, image_bytes,
+            imgur_link=shared_imgur_link, image_available=image_available,
+            base_message=shared_base_message)
+    if enable_whatsapp:
+        pending['whatsapp'] = _notify_executor.submit(
+            send_whatsapp_notification, message_details, image_path_annotated, image_bytes,
+            imgur_link=shared_imgur_link, image_available=image_available,
+            base_message=shared_base_message)
+    results = {}
+    for channel, future in pending.items():
+        try:
+            results[channel] = bool(future.result())
+        except Exception as e:
+            logger.error(f"Error saat fan-out notifikasi {channel}: {e}", exc_info=True)
+            results[channel] = False
+    return results
+
+def send_whatsapp_notification(message_details: dict, image_path_annotated: str = None, image_bytes: bytes = None,
+                               imgur_link: str = None, image_available: bool = None,
+                               base_message: str = None):
     """
     Mengirim notifikasi WhatsApp menggunakan CallMeBot dengan gambar hasil deteksi (via Imgur) dan detail lengkap.
+    Gambar bisa berupa path file atau buffer JPEG in-memory (image_bytes).
+    Jika imgur_link sudah diberikan oleh caller, unggahan Imgur dilewati.
     """
     if not CALLMEBOT_API_KEY or not RECEIVER_WHATSAPP_NUMBER:
         logger.warning("API Key CallMeBot atau Nomor WhatsApp Penerima tidak lengkap. Notifikasi WhatsApp dilewati.")
         return False
 
     logger.info(f"Mencoba mengirim notifikasi WhatsApp via CallMeBot ke nomor: {RECEIVER_WHATSAPP_NUMBER}...")
-    
+
     phone_number_cleaned = RECEIVER_WHATSAPP_NUMBER.lstrip('+')
-    
-    imgur_link_for_wa = None
-    if image_path_annotated and os.path.exists(image_path_annotated):
-        logger.info(f"WhatsApp: Mencoba unggah '{image_path_annotated}' ke Imgur...")
-        imgur_link_for_wa = upload_to_imgur(image_path_annotated)
-    
-    full_text_message_wa = format_rich_notification_message(message_details, imgur_link_for_message=imgur_link_for_wa)
-    
-    if imgur_link_for_wa is None and image_path_annotated and os.path.exists(image_path_annotated):
+
+    if image_available is None:
+        image_available = image_bytes is not None or (image_path_annotated and os.path.exists(image_path_annotated))
+
+    imgur_link_for_wa = imgur_link
+    if imgur_link_for_wa is None and image_available:
+        logger.info("WhatsApp: Mencoba unggah gambar deteksi ke Imgur...")
+        imgur_link_for_wa = upload_image_once(image_path_annotated, image_bytes=image_bytes)
+
+    if base_message is None:
+        base_message = _build_base_message(message_details)
+    full_text_message_wa = _append_image_link(base_message, imgur_link_for_wa)
+
+    if imgur_link_for_wa is None and image_available:
         full_text_message_wa += "\n\n(Info: Gagal mengunggah gambar deteksi ke Imgur untuk pratinjau WhatsApp.)"
-    elif image_path_annotated and not os.path.exists(image_path_annotated): 
+    elif image_path_annotated and not image_available:
         logger.warning(f"WhatsApp: File gambar anotasi tidak ditemukan di '{image_path_annotated}'.")
         full_text_message_wa += "\n\n(Info: File gambar deteksi tidak tersedia untuk notifikasi ini.)"
-    elif not image_path_annotated:
-        logger.info("WhatsApp: Tidak ada path gambar anotasi. Notifikasi akan dikirim tanpa gambar.")
+    elif not image_available:
+        logger.info("WhatsApp: Tidak ada gambar anotasi. Notifikasi akan dikirim tanpa gambar.")
+
+    # Batasi panjang pesan: analisis Gemini yang panjang bisa mendorong
+    # permintaan melewati batas praktis CallMeBot.
+    if len(full_text_message_wa) > _WHATSAPP_MAX_TEXT_CHARS:
+        full_text_message_wa = full_text_message_wa[:_WHATSAPP_MAX_TEXT_CHARS] + "…"
+        logger.info(f"Pesan WhatsApp dipotong ke {_WHATSAPP_MAX_TEXT_CHARS} karakter.")
 
     try:
-        encoded_full_message = urllib.parse.quote_plus(full_text_message_wa)
-        callmebot_url = (f"https://api.callmebot.com/whatsapp.php?"
-                          f"phone={phone_number_cleaned}"
-                          f"&text={encoded_full_message}"
-                          f"&apikey={CALLMEBOT_API_KEY}")
-            
-        logger.debug(f"CallMeBot URL: {callmebot_url}")
-        response = requests.get(callmebot_url, timeout=20)
-        response.raise_for_status() 
-        logger.info(f"Notifikasi WhatsApp berhasil dikirim via CallMeBot. Respons server: {response.text[:100]}")
+        # POST form-encoded: encoding URL dikerjakan massal oleh requests
+        # (urlencode), bukan quote_plus per karakter atas string multi-KB,
+        # dan tidak ada lagi batas panjang URL GET yang bisa terlampaui.
+        response = _http.post(CALLMEBOT_WHATSAPP_URL,
+                              data={'phone': phone_number_cleaned,
+                                    'text': full_text_message_wa,
+                                    'apikey': CALLMEBOT_API_KEY},
+                              timeout=20)
+        response.raise_for_status()
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Notifikasi WhatsApp berhasil dikirim via CallMeBot. Respons server: %s", response.text[:100])
         return True
     except requests.exceptions.RequestException as e:
-        logger.error(f"Gagal mengirim pesan WhatsApp via CallMeBot: {e}")
-        if hasattr(e, 'response') and e.response is not None:
-            logger.error(f"Respons CallMeBot: Status {e.response.status_code}, Isi: {e.response.text}")
+        logger.error("Gagal mengirim pesan WhatsApp via CallMeBot: %s", e)
+        if hasattr(e, 'response') and e.response is not None and logger.isEnabledFor(logging.ERROR):
+            logger.error("Respons CallMeBot: Status %s, Isi: %s", e.response.status_code, e.response.text)
         return False
     except Exception as e_gen:
         logger.error(f"Error lain saat kirim WhatsApp via CallMeBot: {e_gen}", exc_info=True)
-        return False
\ No newline at end of file
+        return False
+
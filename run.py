@@ -3,83 +3,441 @@ import cv2
 import argparse
 import os
 import time
+import queue
 import logging
-import tempfile
-from PIL import Image as PILImage
+import threading
+import collections
+import concurrent.futures
 import numpy as np
 from pathlib import Path
-from dotenv import load_dotenv
-import gc 
-from datetime import datetime 
+from datetime import datetime
 
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 try:
-    from detector import YoloDetector 
+    from detector import YoloDetector
     logger.debug("Modul 'detector' dan kelas 'YoloDetector' berhasil diimpor.")
 except ImportError as e:
     logger.error(f"Gagal mengimpor YoloDetector dari detector.py: {e}. Pastikan file dan nama kelas sudah benar.")
-    exit(1) 
+    exit(1)
 
 try:
-    from notifier import send_telegram_notification, send_whatsapp_notification 
+    from notifier import send_all_notifications
     logger.debug("Fungsi-fungsi dari modul 'notifier' berhasil diimpor.")
 except ImportError as e:
     logger.error(f"Gagal mengimpor dari notifier.py: {e}.")
     exit(1)
 
 try:
-    from utils import apply_clahe_enhancement
+    from utils import ClaheEnhancer
     logger.debug("Fungsi dari modul 'utils' berhasil diimpor.")
 except ImportError as e:
     logger.error(f"Gagal mengimpor dari utils.py: {e}.")
     exit(1)
 
-try:
-    from gemini_analyzer import analyze_image_with_gemini, GEMINI_API_KEY as GEMINI_AVAILABLE_CLI 
-    logger.debug("Fungsi dari modul 'gemini_analyzer' berhasil diimpor.")
-except ImportError as e:
-    logger.error(f"Gagal mengimpor dari gemini_analyzer.py: {e}.")
-    exit(1)
+# gemini_analyzer (berikut SDK google-generativeai di baliknya) sengaja
+# TIDAK diimpor saat startup: proses tanpa --gemini tidak perlu membayar
+# waktu impor dan memori SDK-nya. Impor terjadi saat event pertama yang
+# benar-benar butuh analisis.
+_gemini_analyze_fn = None
+_GEMINI_IMPORT_FAILED = object()  # Sentinel: impor/konfigurasi pernah gagal
 
+def _get_gemini_analyzer():
+    """Mengimpor gemini_analyzer saat pertama dibutuhkan; mengembalikan
+    fungsi analisisnya, atau None bila impor gagal / API key tidak ada."""
+    global _gemini_analyze_fn
+    if _gemini_analyze_fn is None:
+        try:
+            from gemini_analyzer import analyze_image_with_gemini, GEMINI_API_KEY
+            logger.debug("Fungsi dari modul 'gemini_analyzer' berhasil diimpor (lazy).")
+            _gemini_analyze_fn = analyze_image_with_gemini if GEMINI_API_KEY else _GEMINI_IMPORT_FAILED
+        except ImportError as e:
+            logger.error(f"Gagal mengimpor dari gemini_analyzer.py: {e}.")
+            _gemini_analyze_fn = _GEMINI_IMPORT_FAILED
+    return None if _gemini_analyze_fn is _GEMINI_IMPORT_FAILED else _gemini_analyze_fn
 
-load_dotenv() 
-logger.info("Variabel lingkungan dari .env (jika ada) telah dimuat.")
+# Kredensial/.env dibaca SEKALI per proses oleh config.CFG (dimuat saat
+# notifier diimpor di atas); tidak ada load_dotenv kedua di sini.
 
-last_notification_times_cli = {}
+# Gerbang scene-change: frame yang nyaris identik dengan frame sebelumnya
+# (kamera pengawas statis) dilewati tanpa CLAHE + forward pass. Perbandingan
+# memakai thumbnail grayscale 64x64, dan tiap N frame deteksi tetap dipaksa
+# agar kebakaran yang muncul perlahan tidak terlewat.
+_SCENE_THUMB_SIZE = (64, 64)
+_SCENE_CHANGE_THRESHOLD = 4.0  # rata-rata |selisih| per piksel thumbnail
+_FORCE_DETECT_EVERY_N = 30
+# Di atas ambang ini scene dianggap BERGANTI total (bukan sekadar bergerak):
+# LUT simple-contrast yang dibangun dari frame referensi lama dibatalkan.
+_SCENE_CUT_THRESHOLD = 20.0
 
-def attempt_remove_temp_file_cli(file_path, max_retries=3, delay=0.1):
-    if not file_path or not os.path.exists(file_path):
-        logger.debug(f"CLI: Penghapusan file temporer dilewati, path tidak valid atau file tidak ada ({file_path})")
-        return
-    retries = 0
-    while retries < max_retries:
+# Pool kecil untuk seluruh I/O notifikasi (tulis file temporer, Gemini,
+# Telegram, WhatsApp). Jaringan yang lambat tidak lagi menahan loop
+# capture/inferensi — loop hanya men-submit pekerjaan lalu lanjut.
+notification_executor_cli = concurrent.futures.ThreadPoolExecutor(
+    max_workers=2, thread_name_prefix="detectorx-cli-notify")
+
+class JpegBufferPool:
+    """
+    Pool bytearray terbatas untuk menampung hasil encode JPEG frame deteksi.
+    Buffer dipinjam saat event terjadi, diisi salinan output cv2.imencode
+    (API Python-nya tidak menerima dst, jadi array hasilnya sendiri tetap
+    dialokasikan cv2), dipakai worker notifikasi lewat memoryview, lalu
+    dikembalikan setelah seluruh pengiriman selesai. Alarm beruntun selama
+    bermenit-menit jadi tidak menebar alokasi ratusan KB per event.
+    """
+
+    def __init__(self, pool_size: int = 4, initial_capacity: int = 512 * 1024):
+        self._buffers = queue.LifoQueue(maxsize=pool_size)
+        for _ in range(pool_size):
+            self._buffers.put(bytearray(initial_capacity))
+
+    def acquire(self, needed_size: int) -> bytearray:
+        try:
+            buffer = self._buffers.get_nowait()
+        except queue.Empty:
+            # Pool sedang habis (banyak event paralel): alokasikan baru;
+            # release() membuangnya lagi bila pool sudah penuh kembali.
+            buffer = bytearray(needed_size)
+        if len(buffer) < needed_size:
+            buffer = bytearray(needed_size)  # Tumbuh mengikuti JPEG terbesar
+        return buffer
+
+    def release(self, buffer: bytearray):
         try:
-            os.remove(file_path)
-            logger.info(f"CLI: File temporer '{file_path}' berhasil dihapus pada percobaan ke-{retries+1}.")
-            return 
-        except PermissionError as pe:
-            retries += 1
-            logger.warning(f"CLI: Percobaan ke-{retries} gagal menghapus '{file_path}': {pe}. Menunggu {delay} detik.")
-            if retries < max_retries: time.sleep(delay)
-            else: logger.error(f"CLI: Gagal menghapus file temporer '{file_path}' setelah {max_retries} percobaan karena PermissionError: {pe}.")
-        except Exception as e:
-            logger.error(f"CLI: Error tidak terduga saat mencoba menghapus file temporer '{file_path}': {e}", exc_info=True)
+            self._buffers.put_nowait(buffer)
+        except queue.Full:
+            pass
+
+jpeg_buffer_pool = JpegBufferPool()
+
+class PipelineBuffers:
+    """
+    Buffer kerja per-resolusi untuk tahap inferensi CLI: grayscale ukuran
+    penuh plus dua thumbnail scene-change dialokasikan SEKALI terhadap (H, W)
+    frame pertama dan diisi ulang lewat dst=; realokasi hanya terjadi bila
+    resolusi sumber berubah. Buffer LAB/L/a/b untuk CLAHE dikelola terpisah
+    oleh utils.ClaheEnhancer, dan scratch JPEG oleh JpegBufferPool.
+    """
+
+    def __init__(self):
+        self._shape = None
+        self.gray = None
+        self.scene_thumb = None
+        self.prev_scene_thumb = None
+
+    def ensure(self, shape):
+        """Menyiapkan buffer untuk shape frame ini; True bila baru
+        dialokasikan (thumbnail sebelumnya tidak lagi valid)."""
+        if shape[:2] == self._shape:
+            return False
+        height, width = shape[:2]
+        self.gray = np.empty((height, width), dtype=np.uint8)
+        self.scene_thumb = np.empty((_SCENE_THUMB_SIZE[1], _SCENE_THUMB_SIZE[0]), dtype=np.uint8)
+        self.prev_scene_thumb = np.empty_like(self.scene_thumb)
+        self._shape = shape[:2]
+        return True
+
+# Pilihan backend eksplisit untuk flag --backend; 'auto' memilih sendiri
+# berdasarkan jenis sumber dan OS.
+_CAPTURE_BACKENDS = {
+    'ffmpeg': cv2.CAP_FFMPEG,
+    'v4l2': cv2.CAP_V4L2,
+    'dshow': cv2.CAP_DSHOW,
+}
+
+def _open_cli_capture(capture_source_value, backend_name='auto'):
+    """
+    Membuka VideoCapture dengan backend berlatensi rendah: CAP_FFMPEG untuk
+    URL stream (mengandung '://'), CAP_DSHOW (Windows) / CAP_V4L2 (lainnya)
+    untuk ID kamera, dan backend default untuk file. Untuk sumber live,
+    CAP_PROP_BUFFERSIZE=1 mencegah driver menimbun frame lama.
+    """
+    backend = _CAPTURE_BACKENDS.get(backend_name)
+    if backend is None and backend_name == 'auto':
+        if isinstance(capture_source_value, int):
+            backend = cv2.CAP_DSHOW if os.name == 'nt' else cv2.CAP_V4L2
+        elif '://' in str(capture_source_value):
+            backend = cv2.CAP_FFMPEG
+
+    if backend is not None:
+        video_capture_cli = cv2.VideoCapture(capture_source_value, backend)
+        if not video_capture_cli.isOpened():
+            logger.warning(f"CLI: Backend pilihan gagal membuka sumber '{capture_source_value}'; mencoba backend default OpenCV.")
+            video_capture_cli.release()
+            video_capture_cli = cv2.VideoCapture(capture_source_value)
+    else:
+        video_capture_cli = cv2.VideoCapture(capture_source_value)
+
+    if video_capture_cli.isOpened() and (
+            isinstance(capture_source_value, int) or '://' in str(capture_source_value)):
+        video_capture_cli.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    return video_capture_cli
+
+def _put_dropping_oldest(target_queue, item):
+    """Memasukkan item ke antrian; bila penuh, item TERLAMA dibuang dulu."""
+    try:
+        target_queue.put(item, timeout=0.05)
+    except queue.Full:
+        try: target_queue.get_nowait()
+        except queue.Empty: pass
+        try: target_queue.put_nowait(item)
+        except queue.Full: pass
+
+# grab() yang selesai lebih lama dari ini dianggap MENUNGGU frame baru dari
+# driver (bukan sekadar mengambil dari buffer) — backlog sudah terkuras.
+_GRAB_WAIT_THRESHOLD_S = 0.005
+
+def _drain_to_latest(video_capture_cli, max_latency_s, stop_event):
+    """
+    Membuang backlog frame dengan grab() lalu men-decode hanya frame TERBARU
+    lewat retrieve(). grab() jauh lebih murah daripada read() penuh karena
+    decode JPEG/H.264 dilewati untuk frame yang toh akan dibuang.
+
+    Heuristik berhenti: bila grab() harus MENUNGGU lebih dari beberapa
+    milidetik, berarti buffer driver sudah kosong dan frame itulah yang
+    terbaru. Total durasi pengurasan juga dibatasi max_latency_s sebagai
+    pagar bila sumber menyuplai frame lebih cepat daripada grab().
+    """
+    if not video_capture_cli.grab():
+        return False, None
+    drain_deadline = time.monotonic() + max_latency_s
+    while not stop_event.is_set():
+        t_grab = time.monotonic()
+        if t_grab >= drain_deadline:
+            break
+        if not video_capture_cli.grab():
+            break
+        if time.monotonic() - t_grab > _GRAB_WAIT_THRESHOLD_S:
+            break
+    return video_capture_cli.retrieve()
+
+def _capture_worker_cli(video_capture_cli, frame_queue, stop_event,
+                        allow_frame_skipping=False, max_latency_s=0.0):
+    """
+    Thread tahap-1: membaca frame dari sumber dan mendorongnya ke antrian.
+    Saat inferensi lebih lambat dari sumber (antrian penuh), frame terlama
+    dibuang agar latensi pada kamera/stream jaringan tidak menumpuk.
+
+    Untuk sumber live (kamera/stream jaringan) dengan max_latency_s > 0,
+    backlog di sisi driver juga dikuras lewat _drain_to_latest agar latensi
+    end-to-end tetap terikat; untuk file video, skipping dimatikan supaya
+    semua frame tetap diproses: put MEMBLOK (backpressure ke pembacaan file)
+    alih-alih membuang frame terlama.
+    """
+    drain_enabled = allow_frame_skipping and max_latency_s > 0
+    while not stop_event.is_set():
+        if drain_enabled:
+            ret, frame_bgr_stream = _drain_to_latest(video_capture_cli, max_latency_s, stop_event)
+        else:
+            ret, frame_bgr_stream = video_capture_cli.read()
+        if not ret:
+            logger.info("Selesai memproses sumber video atau stream berakhir (tidak ada frame lagi).")
+            frame_queue.put(None)  # Sentinel: stream berakhir
             return
+        if allow_frame_skipping:
+            _put_dropping_oldest(frame_queue, frame_bgr_stream)
+        else:
+            # Sumber file: tunggu sampai ada slot (timeout pendek hanya agar
+            # stop_event tetap terpantau), jangan pernah membuang frame.
+            while not stop_event.is_set():
+                try:
+                    frame_queue.put(frame_bgr_stream, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+
+def _process_detection_event_cli(message_details_cli, jpeg_buffer, jpeg_length,
+                                 enable_gemini_cli, enable_telegram_cli,
+                                 enable_whatsapp_cli, gemini_prompt_cli):
+    """
+    Dijalankan di notification_executor_cli: analisis Gemini lalu fan-out
+    Telegram/WhatsApp lewat send_all_notifications (paralel, satu unggahan
+    Imgur + satu pesan dasar untuk kedua kanal), seluruhnya dari buffer JPEG
+    in-memory — tanpa file temporer dan tanpa round-trip encode lewat PIL.
+    jpeg_buffer dipinjam dari jpeg_buffer_pool dan dikembalikan setelah
+    semua kanal selesai.
+    """
+    annotated_jpeg_bytes = memoryview(jpeg_buffer)[:jpeg_length]
+    try:
+        analyze_fn = _get_gemini_analyzer() if enable_gemini_cli else None
+        if analyze_fn is not None:
+            logger.info("CLI: Menganalisis gambar deteksi dengan Gemini AI...")
+            gemini_analysis_result_cli = analyze_fn(
+                None, gemini_prompt_cli, image_bytes=annotated_jpeg_bytes)
+            logger.info(f"--- Hasil Analisis Gemini AI (CLI) ---\n{gemini_analysis_result_cli}\n------------------------------------")
+            message_details_cli['gemini_analysis'] = gemini_analysis_result_cli
+
+        if enable_telegram_cli or enable_whatsapp_cli:
+            logger.info("CLI: Mengirim notifikasi ke kanal yang diaktifkan...")
+            send_all_notifications(message_details_cli, image_bytes=annotated_jpeg_bytes,
+                                   enable_telegram=enable_telegram_cli,
+                                   enable_whatsapp=enable_whatsapp_cli)
+
+    except Exception as e_notif_process_cli:
+        logger.error(f"CLI: Terjadi error saat proses notifikasi/analisis Gemini: {e_notif_process_cli}", exc_info=True)
+    finally:
+        annotated_jpeg_bytes.release()
+        jpeg_buffer_pool.release(jpeg_buffer)
+
+def _inference_worker_cli(detector_cli, frame_queue, display_buffer, stop_event,
+                          confidence_cli, iou_cli, imgsz_cli, augment_cli,
+                          use_clahe_cli, clahe_downsample_cli, simple_contrast_cli,
+                          notification_cooldown_cli,
+                          enable_telegram_cli, enable_whatsapp_cli,
+                          enable_gemini_cli, location_name_cli, source_info_for_notif):
+    """
+    Thread tahap-2: CLAHE + deteksi YOLO. Frame anotasi didorong ke
+    display_buffer (deque(maxlen=1)) yang dibaca thread utama — append tidak
+    pernah memblok, frame lama otomatis tergeser bila GUI tertinggal. Event
+    deteksi yang lolos cooldown dilempar ke notification_executor_cli tanpa
+    menunggu I/O-nya selesai.
+    """
+    frame_count = 0
+    # Satu enhancer per thread inferensi: buffer kerjanya dipakai ulang
+    # antar frame dan tidak thread-safe.
+    clahe_enhancer = (ClaheEnhancer(downsample=clahe_downsample_cli,
+                                    simple_contrast=simple_contrast_cli)
+                      if use_clahe_cli else None)
+    # Cooldown per kelas sebagai array yang diindeks class_id integer:
+    # tanpa .lower() + hash string + dict lookup per objek di hot path.
+    num_classes = (max(detector_cli.class_names.keys()) + 1) if detector_cli.class_names else 2
+    last_notification_times = np.zeros(num_classes, dtype=np.float64)
+    pipeline_buffers = PipelineBuffers()
+    have_prev_scene_thumb = False
+    last_annotated_frame = None
+    while not stop_event.is_set():
+        try:
+            frame_bgr_stream = frame_queue.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        if frame_bgr_stream is None:  # Sentinel dari capture worker
+            break
+
+        frame_count += 1
+        if pipeline_buffers.ensure(frame_bgr_stream.shape):
+            have_prev_scene_thumb = False
+        cv2.cvtColor(frame_bgr_stream, cv2.COLOR_BGR2GRAY, dst=pipeline_buffers.gray)
+        cv2.resize(pipeline_buffers.gray, _SCENE_THUMB_SIZE,
+                   dst=pipeline_buffers.scene_thumb, interpolation=cv2.INTER_AREA)
+        scene_delta = None
+        if have_prev_scene_thumb:
+            scene_delta = (cv2.norm(pipeline_buffers.scene_thumb,
+                                    pipeline_buffers.prev_scene_thumb, cv2.NORM_L1)
+                           / pipeline_buffers.scene_thumb.size)
+        if (scene_delta is not None and last_annotated_frame is not None
+                and frame_count % _FORCE_DETECT_EVERY_N != 0
+                and scene_delta < _SCENE_CHANGE_THRESHOLD):
+            # Scene statis: pakai ulang frame beranotasi terakhir tanpa deteksi.
+            np.copyto(pipeline_buffers.prev_scene_thumb, pipeline_buffers.scene_thumb)
+            display_buffer.append(last_annotated_frame)
+            logger.debug(f"CLI: Frame #{frame_count} dilewati (scene tidak berubah).")
+            continue
+        np.copyto(pipeline_buffers.prev_scene_thumb, pipeline_buffers.scene_thumb)
+        have_prev_scene_thumb = True
+        if (clahe_enhancer is not None and scene_delta is not None
+                and scene_delta > _SCENE_CUT_THRESHOLD):
+            # Scene cut: LUT simple-contrast lama tidak representatif lagi.
+            clahe_enhancer.invalidate_lut()
+
+        logger.debug(f"CLI: Frame #{frame_count} diterima dari antrian. Memulai pra-pemrosesan dan deteksi...")
+        # Tidak ada .copy() defensif di sini: tanpa CLAHE tidak ada mutasi
+        # piksel sebelum deteksi, jadi buffer hasil read() dipakai langsung;
+        # dengan CLAHE, cvtColor sudah mengalokasikan buffer baru sendiri.
+        frame_to_process_cli = frame_bgr_stream
+        if use_clahe_cli:
+            logger.debug(f"CLI: Menerapkan CLAHE pada frame #{frame_count}...")
+            # Jalur BGR langsung (satu BGR->LAB dan satu LAB->BGR) dengan
+            # buffer kerja yang dipakai ulang antar frame.
+            enhanced_bgr_frame = clahe_enhancer.enhance_bgr(frame_bgr_stream)
+            if enhanced_bgr_frame is not None:
+                frame_to_process_cli = enhanced_bgr_frame
+
+        detections, annotated_frame_cli_output = detector_cli.detect(
+            frame_to_process_cli,
+            confidence_threshold=confidence_cli,
+            iou_threshold=iou_cli,
+            imgsz=imgsz_cli,
+            augment=augment_cli,
+            return_arrays=True
+        )
+        num_detected = int(detections['cls'].shape[0])
+        logger.info(f"CLI: Deteksi pada frame #{frame_count} selesai. Jumlah objek 'fire'/'smoke' yang lolos filter label: {num_detected}")
+        if (annotated_frame_cli_output is frame_to_process_cli
+                and frame_to_process_cli is not frame_bgr_stream):
+            # Tanpa box, detect() mengembalikan frame input apa adanya — di
+            # sini itu buffer _out milik enhancer yang ditimpa in-place pada
+            # frame berikutnya. Salin dulu agar frame yang dipublikasikan ke
+            # thread GUI (dan dipakai ulang saat scene statis) tidak ikut
+            # termutasi oleh thread inferensi.
+            annotated_frame_cli_output = annotated_frame_cli_output.copy()
+        last_annotated_frame = annotated_frame_cli_output
+        display_buffer.append(annotated_frame_cli_output)
+
+        if num_detected == 0:
+            continue
+        # Filter cooldown tervektorisasi: satu compare + mask untuk semua box,
+        # loop Python hanya menyentuh kandidat yang siap dikirim.
+        current_event_time = time.time()
+        ready_mask = (current_event_time - last_notification_times[detections['cls']]) > notification_cooldown_cli
+        if logger.isEnabledFor(logging.DEBUG) and not ready_mask.all():
+            logger.debug(f"CLI: {int((~ready_mask).sum())} deteksi masih dalam masa cooldown notifikasi.")
+        for i in np.nonzero(ready_mask)[0]:
+            class_id_detected = int(detections['cls'][i])
+            confidence_score = float(detections['conf'][i])
+            # Cek ulang skalar: dua box sekelas dalam satu frame tidak boleh
+            # sama-sama lolos hanya karena mask dihitung sebelum stempel.
+            if current_event_time - last_notification_times[class_id_detected] > notification_cooldown_cli:
+                # Label string baru dibutuhkan di sini, sekali per notifikasi.
+                label_detected = detector_cli.class_names.get(
+                    class_id_detected, f"UnknownID_{class_id_detected}").lower()
+                logger.info(f"===> NOTIFIKASI UNTUK LOKASI '{location_name_cli}': Jenis '{label_detected.upper()}' (Kepercayaan: {confidence_score:.2f}).")
+
+                message_details_cli = {
+                    'detection_type': label_detected.capitalize(),
+                    'location': location_name_cli,
+                    'source_info': source_info_for_notif,
+                    'confidence': confidence_score,
+                    'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                    'gemini_analysis': None
+                }
+                gemini_prompt_cli = (f"Gambar ini menunjukkan deteksi '{label_detected}' di lokasi '{location_name_cli}' {source_info_for_notif} dengan anotasi visual. "
+                                     f"Berikan analisis singkat mengenai potensi bahaya, kemungkinan penyebab, dan langkah keamanan dasar (poin-poin, emoji jika relevan). Ringkas.")
+                # Encode sekali di sini (libjpeg-turbo via cv2), lalu bytes
+                # yang sama dipakai Gemini, Telegram, maupun WhatsApp.
+                encode_ok, encoded_jpeg = cv2.imencode(
+                    '.jpg', annotated_frame_cli_output, [cv2.IMWRITE_JPEG_QUALITY, 85])
+                if not encode_ok:
+                    logger.error("CLI: Gagal meng-encode frame anotasi ke JPEG; notifikasi dilewati.")
+                    continue
+                # Salin hasil encode ke buffer pinjaman dari pool alih-alih
+                # mengalokasikan objek bytes baru per event (tobytes()).
+                jpeg_length = int(encoded_jpeg.size)
+                jpeg_buffer = jpeg_buffer_pool.acquire(jpeg_length)
+                np.frombuffer(jpeg_buffer, dtype=np.uint8, count=jpeg_length)[:] = encoded_jpeg.ravel()
+                notification_executor_cli.submit(
+                    _process_detection_event_cli,
+                    message_details_cli, jpeg_buffer, jpeg_length,
+                    enable_gemini_cli, enable_telegram_cli,
+                    enable_whatsapp_cli, gemini_prompt_cli)
+                # Cooldown dicap saat submit agar deteksi beruntun di frame
+                # berikutnya tidak ikut mengantre selama I/O masih berjalan.
+                last_notification_times[class_id_detected] = current_event_time
+    display_buffer.append(None)  # Sentinel: tidak ada frame anotasi lagi
 
 def process_video_source_cli(
-    source_str, model_path_cli, 
+    source_str, model_path_cli,
     confidence_cli, iou_cli, imgsz_cli, augment_cli,
     use_clahe_cli, notification_cooldown_cli,
-    enable_telegram_cli, enable_whatsapp_cli, 
-    enable_gemini_cli, location_name_cli
+    enable_telegram_cli, enable_whatsapp_cli,
+    enable_gemini_cli, location_name_cli,
+    max_latency_ms_cli=200, backend_cli='auto', clahe_downsample_cli=1,
+    headless_cli=False, simple_contrast_cli=False
     ):
     logger.info(f"==> Memulai fungsi 'process_video_source_cli' untuk sumber: {source_str}")
-    global last_notification_times_cli 
-    
+
     detector_cli = YoloDetector(model_path=model_path_cli)
-    if not detector_cli.model: 
+    if not detector_cli.model:
         logger.error(f"Gagal memuat model YOLO dari '{model_path_cli}' di dalam process_video_source_cli. Proses CLI dihentikan.")
         return
 
@@ -87,10 +445,10 @@ def process_video_source_cli(
     logger.info(f"Parameter Deteksi DIGUNAKAN: Confidence={confidence_cli}, IoU={iou_cli}, ImgSz={imgsz_cli}, Augment={augment_cli}, CLAHE={use_clahe_cli}")
     logger.info(f"Parameter Notifikasi: Cooldown={notification_cooldown_cli}s, Telegram={enable_telegram_cli}, WhatsApp={enable_whatsapp_cli}")
     logger.info(f"Analisis Gemini AI: {enable_gemini_cli}, Lokasi: {location_name_cli}")
-    
+
     is_camera_source = source_str.lower() == 'camera' or source_str.isdigit()
     capture_source_value = int(source_str) if source_str.isdigit() else (0 if source_str.lower() == 'camera' else source_str)
-    
+
     source_info_for_notif = ""
     if is_camera_source:
         source_info_for_notif = f"dari Kamera ID: {capture_source_value}"
@@ -98,122 +456,88 @@ def process_video_source_cli(
         source_info_for_notif = f"dari File: {os.path.basename(source_str)}"
 
 
-    logger.info(f"Mencoba membuka sumber capture: {capture_source_value}")
-    video_capture_cli = cv2.VideoCapture(capture_source_value)
+    logger.info(f"Mencoba membuka sumber capture: {capture_source_value} (backend: {backend_cli})")
+    video_capture_cli = _open_cli_capture(capture_source_value, backend_cli)
     if not video_capture_cli.isOpened():
         logger.error(f"Tidak dapat membuka sumber video/kamera: '{source_str}' (diproses sebagai: {capture_source_value}). Pastikan sumber tersedia dan path benar.")
         return
 
     logger.info(f"Sumber video/kamera '{capture_source_value}' berhasil dibuka.")
-    cv2.namedWindow("Deteksi Api & Asap - Mode CLI", cv2.WINDOW_NORMAL)
-    
-    frame_count = 0
+    if not headless_cli:
+        cv2.namedWindow("Deteksi Api & Asap - Mode CLI", cv2.WINDOW_NORMAL)
+
+    # Pipeline 3 tahap: capture (thread) -> inferensi (thread) -> display
+    # (thread utama). Antrian capture kecil (maxsize=2) menjaga latensi tetap
+    # rendah: yang tertinggal dibuang, bukan diantrekan. Untuk display cukup
+    # deque(maxlen=1) — GUI hanya butuh frame TERBARU, dan append dari thread
+    # inferensi tidak pernah memblok.
+    frame_queue = queue.Queue(maxsize=2)
+    display_buffer = collections.deque(maxlen=1)
+    stop_event = threading.Event()
+    # Frame skipping hanya untuk sumber live; file video tetap diproses utuh.
+    allow_frame_skipping = is_camera_source or '://' in source_str
+    capture_thread = threading.Thread(
+        target=_capture_worker_cli,
+        args=(video_capture_cli, frame_queue, stop_event,
+              allow_frame_skipping, max_latency_ms_cli / 1000.0),
+        daemon=True, name="detectorx-cli-capture")
+    inference_thread = threading.Thread(
+        target=_inference_worker_cli,
+        args=(detector_cli, frame_queue, display_buffer, stop_event,
+              confidence_cli, iou_cli, imgsz_cli, augment_cli,
+              use_clahe_cli, clahe_downsample_cli, simple_contrast_cli,
+              notification_cooldown_cli,
+              enable_telegram_cli, enable_whatsapp_cli,
+              enable_gemini_cli, location_name_cli, source_info_for_notif),
+        daemon=True, name="detectorx-cli-infer")
+    capture_thread.start()
+    inference_thread.start()
+
+    displayed_frame_count = 0
     try:
-        while video_capture_cli.isOpened():
-            frame_count += 1
-            logger.debug(f"CLI: Membaca frame baru #{frame_count}...")
-            ret, frame_bgr_stream = video_capture_cli.read() 
-            if not ret:
-                logger.info("Selesai memproses sumber video atau stream berakhir (tidak ada frame lagi).")
-                break 
-            
-            logger.debug(f"CLI: Frame #{frame_count} berhasil dibaca. Memulai pra-pemrosesan dan deteksi...")
-            frame_to_process_cli = frame_bgr_stream.copy() 
-            if use_clahe_cli: 
-                logger.debug(f"CLI: Menerapkan CLAHE pada frame #{frame_count}...")
-                enhanced_rgb_frame = apply_clahe_enhancement(cv2.cvtColor(frame_to_process_cli, cv2.COLOR_BGR2RGB))
-                if enhanced_rgb_frame is not None:
-                    frame_to_process_cli = cv2.cvtColor(enhanced_rgb_frame, cv2.COLOR_RGB2BGR)
-            
-            detected_objects, annotated_frame_cli_output = detector_cli.detect(
-                frame_to_process_cli, 
-                confidence_threshold=confidence_cli, 
-                iou_threshold=iou_cli,
-                imgsz=imgsz_cli,
-                augment=augment_cli
-            )
-            logger.info(f"CLI: Deteksi pada frame #{frame_count} selesai. Jumlah objek 'fire'/'smoke' yang lolos filter label: {len(detected_objects)}")
+        while True:
+            try:
+                annotated_frame_cli_output = display_buffer.popleft()
+            except IndexError:
+                # Belum ada frame baru: tetap servis event GUI sebentar
+                # (waitKey juga mencegah busy-spin), lalu cek lagi.
+                if headless_cli:
+                    time.sleep(0.05)
+                else:
+                    cv2.waitKey(1)
+                if not inference_thread.is_alive() and not display_buffer:
+                    logger.info("Thread inferensi CLI berhenti tanpa sentinel. Menghentikan loop tampilan.")
+                    break
+                continue
+            if annotated_frame_cli_output is None:  # Sentinel dari inference worker
+                break
+            if headless_cli:
+                continue  # Tanpa GUI: frame cukup dikonsumsi dari deque
+            displayed_frame_count += 1
             cv2.imshow("Deteksi Api & Asap - Mode CLI", annotated_frame_cli_output)
 
-            for det_obj in detected_objects: 
-                label_detected = det_obj['label'].lower()
-                confidence_score = det_obj['confidence']
-                
-                current_event_time = time.time()
-                if (current_event_time - last_notification_times_cli.get(label_detected, 0)) > notification_cooldown_cli:
-                    logger.info(f"===> NOTIFIKASI UNTUK LOKASI '{location_name_cli}': Jenis '{label_detected.upper()}' (Kepercayaan: {confidence_score:.2f}).")
-                    
-                    temp_annotated_image_path_cli = None 
-                    fp_cli_annotated_obj = None 
-                    pil_annotated_cli_for_saving = None 
-                    gemini_analysis_result_cli = None
-                    timestamp_cli_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                    
-                    try:
-                        pil_annotated_cli_for_saving = PILImage.fromarray(cv2.cvtColor(annotated_frame_cli_output, cv2.COLOR_BGR2RGB))
-                        fp_cli_annotated_obj = tempfile.NamedTemporaryFile(delete=False, suffix=".jpg", prefix=f"cli_annotated_{label_detected}_")
-                        pil_annotated_cli_for_saving.save(fp_cli_annotated_obj, "JPEG")
-                        temp_annotated_image_path_cli = fp_cli_annotated_obj.name
-                        fp_cli_annotated_obj.close(); fp_cli_annotated_obj = None 
-                        logger.debug(f"CLI: Frame ANOTASI disimpan ke file temporer: {temp_annotated_image_path_cli}")
-                        
-                        if enable_gemini_cli and GEMINI_AVAILABLE_CLI and temp_annotated_image_path_cli:
-                            logger.info("CLI: Menganalisis gambar deteksi dengan Gemini AI...")
-                            gemini_prompt_cli = (f"Gambar ini menunjukkan deteksi '{label_detected}' di lokasi '{location_name_cli}' {source_info_for_notif} dengan anotasi visual. "
-                                                 f"Berikan analisis singkat mengenai potensi bahaya, kemungkinan penyebab, dan langkah keamanan dasar (poin-poin, emoji jika relevan). Ringkas.")
-                            gemini_analysis_result_cli = analyze_image_with_gemini(temp_annotated_image_path_cli, gemini_prompt_cli)
-                            logger.info(f"--- Hasil Analisis Gemini AI (CLI) ---\n{gemini_analysis_result_cli}\n------------------------------------")
-
-                        # --- PERSIAPAN MESSAGE_DETAILS BARU UNTUK CLI ---
-                        message_details_cli = {
-                            'detection_type': label_detected.capitalize(),
-                            'location': location_name_cli,
-                            'source_info': source_info_for_notif,
-                            'confidence': confidence_score,
-                            'timestamp': timestamp_cli_str,
-                            'gemini_analysis': gemini_analysis_result_cli
-                        }
-                        
-                        if enable_telegram_cli:
-                            logger.info("CLI: Mengirim notifikasi via Telegram...")
-                            send_telegram_notification(message_details_cli, image_path_annotated=temp_annotated_image_path_cli)
-                        
-                        if enable_whatsapp_cli:
-                            logger.info("CLI: Mengirim notifikasi via WhatsApp (CallMeBot)...")
-                            send_whatsapp_notification(message_details_cli, image_path_annotated=temp_annotated_image_path_cli)
-                        
-                        last_notification_times_cli[label_detected] = current_event_time 
-
-                    except Exception as e_notif_process_cli: 
-                        logger.error(f"CLI: Terjadi error saat proses notifikasi/analisis Gemini: {e_notif_process_cli}", exc_info=True)
-                    finally:
-                        if hasattr(pil_annotated_cli_for_saving, 'close'): 
-                            try: pil_annotated_cli_for_saving.close()
-                            except: pass
-                        if fp_cli_annotated_obj is not None : 
-                            try: fp_cli_annotated_obj.close()
-                            except: pass
-                        gc.collect() 
-                        if temp_annotated_image_path_cli: 
-                            attempt_remove_temp_file_cli(temp_annotated_image_path_cli)
-                else: 
-                    logger.debug(f"CLI: Deteksi '{label_detected}' masih dalam masa cooldown notifikasi.")
-            
-            key_press_event = cv2.waitKey(1) & 0xFF 
-            if key_press_event == ord('q') or key_press_event == 27: 
+            key_press_event = cv2.waitKey(1) & 0xFF
+            if key_press_event == ord('q') or key_press_event == 27:
                 logger.info("Perintah keluar (q/ESC) diterima dari keyboard. Menghentikan proses CLI.")
                 break
-            try: 
-                if cv2.getWindowProperty("Deteksi Api & Asap - Mode CLI", cv2.WND_PROP_VISIBLE) < 1: 
-                    logger.info("Jendela tampilan ('Deteksi Api & Asap - Mode CLI') ditutup oleh pengguna. Menghentikan proses CLI.")
+            # Properti window cukup dicek tiap 10 frame: lookup + try/except
+            # per frame tidak sepadan hanya untuk mendeteksi tombol close.
+            if displayed_frame_count % 10 == 0:
+                try:
+                    if cv2.getWindowProperty("Deteksi Api & Asap - Mode CLI", cv2.WND_PROP_VISIBLE) < 1:
+                        logger.info("Jendela tampilan ('Deteksi Api & Asap - Mode CLI') ditutup oleh pengguna. Menghentikan proses CLI.")
+                        break
+                except cv2.error:
+                    logger.info("Jendela tampilan sudah tidak ada (kemungkinan ditutup paksa). Menghentikan proses CLI.")
                     break
-            except cv2.error: 
-                logger.info("Jendela tampilan sudah tidak ada (kemungkinan ditutup paksa). Menghentikan proses CLI.")
-                break
     finally:
+        stop_event.set()
+        capture_thread.join(timeout=2.0)
+        inference_thread.join(timeout=2.0)
         if video_capture_cli and video_capture_cli.isOpened():
-            video_capture_cli.release() 
-        cv2.destroyAllWindows() 
+            video_capture_cli.release()
+        if not headless_cli:
+            cv2.destroyAllWindows()
         logger.info("Sumber video CLI telah dilepaskan dan semua jendela OpenCV ditutup.")
 
 if __name__ == "__main__":
@@ -221,18 +545,23 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Skrip Deteksi Api & Asap menggunakan YOLO (Mode Command-Line).")
     parser.add_argument("--model", type=str, default="best.pt", help="Path menuju file model YOLO (.pt). Default: best.pt")
     parser.add_argument("--source", type=str, default="0", help="Path menuju file video, ID kamera (misalnya '0' untuk default), atau string 'camera'. Default: 0")
-    parser.add_argument("--confidence", type=float, default=0.20, help="Ambang batas kepercayaan deteksi (0.0-1.0). Default: 0.20") 
+    parser.add_argument("--confidence", type=float, default=0.20, help="Ambang batas kepercayaan deteksi (0.0-1.0). Default: 0.20")
     parser.add_argument("--iou", type=float, default=0.45, help="Ambang batas IoU NMS (0.0-1.0). Default: 0.45")
     parser.add_argument("--imgsz", type=int, default=640, help="Ukuran gambar input model (kelipatan 32). Default: 640")
     parser.add_argument("--augment", action='store_true', help="Aktifkan Test-Time Augmentation (TTA).")
     parser.add_argument("--clahe", action='store_true', help="Aktifkan pra-pemrosesan CLAHE.")
-    parser.add_argument("--cooldown", type=int, default=10, help="Cooldown notifikasi (detik). Default: 10") 
+    parser.add_argument("--clahe-downsample", type=int, default=1, help="Faktor perkecil channel L saat CLAHE (histogram dihitung pada resolusi 1/N). 1 = resolusi penuh. Default: 1")
+    parser.add_argument("--simple-contrast", action='store_true', help="Ganti CLAHE per-frame dengan LUT contrast-stretch dari frame referensi (jauh lebih murah untuk scene seragam); CLAHE penuh tetap dijalankan saat scene berganti.")
+    parser.add_argument("--cooldown", type=int, default=10, help="Cooldown notifikasi (detik). Default: 10")
+    parser.add_argument("--max-latency-ms", type=int, default=200, help="Budget latensi sumber live (ms); backlog frame di atas budget ini dibuang. 0 = nonaktif. Default: 200")
+    parser.add_argument("--backend", type=str, default="auto", choices=["auto", "ffmpeg", "v4l2", "dshow"], help="Backend cv2.VideoCapture. 'auto' memilih sesuai jenis sumber dan OS. Default: auto")
+    parser.add_argument("--headless", action='store_true', help="Jalankan tanpa jendela tampilan (untuk server/monitoring jarak jauh); hentikan dengan Ctrl+C.")
     parser.add_argument("--telegram", action='store_true', help="Aktifkan notifikasi Telegram.")
     parser.add_argument("--whatsapp", action='store_true', help="Aktifkan notifikasi WhatsApp (CallMeBot).")
     # Argumen --imgur dihilangkan karena notifier.py menangani logika Imgur secara internal
     parser.add_argument("--gemini", action='store_true', help="Aktifkan analisis Gemini AI.")
     parser.add_argument("--location", type=str, default="CLI-Feed-DetectorX", help="Nama lokasi monitoring. Default: CLI-Feed-DetectorX")
-    
+
     args = parser.parse_args()
     logger.info(f"Argumen CLI yang diterima: {args}")
 
@@ -241,7 +570,7 @@ if __name__ == "__main__":
         logger.error("Nilai --confidence harus antara 0.0 dan 1.0. Menghentikan skrip."); exit(1)
     if not (0.0 <= args.iou <= 1.0):
         logger.error("Nilai --iou (IoU threshold) harus antara 0.0 dan 1.0. Menghentikan skrip."); exit(1)
-    
+
     model_file = Path(args.model)
     if not model_file.is_file():
         logger.error(f"File model tidak ditemukan di path: {args.model} (Path absolut: {model_file.resolve()}). Pastikan file model ada di lokasi yang benar atau berikan path yang sesuai. Menghentikan skrip.")
@@ -251,10 +580,12 @@ if __name__ == "__main__":
 
     logger.info("Validasi argumen CLI selesai. Memanggil process_video_source_cli...")
     process_video_source_cli(
-        args.source, args.model, 
+        args.source, args.model,
         args.confidence, args.iou, args.imgsz, args.augment,
-        args.clahe, args.cooldown, 
-        args.telegram, args.whatsapp, 
-        args.gemini, args.location
+        args.clahe, args.cooldown,
+        args.telegram, args.whatsapp,
+        args.gemini, args.location,
+        args.max_latency_ms, args.backend, args.clahe_downsample,
+        args.headless, args.simple_contrast
     )
-    logger.info("Fungsi process_video_source_cli telah selesai dieksekusi.")
\ No newline at end of file
+    logger.info("Fungsi process_video_source_cli telah selesai dieksekusi.")
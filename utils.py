@@ -1,6 +1,7 @@
 # utils.py
 import io
 import logging
+import threading
 import cv2
 import numpy as np
 from PIL import Image
@@ -22,26 +23,231 @@ def image_bytes_to_rgb_numpy(image_bytes):
         logger.error(f"Error saat mengkonversi image bytes ke NumPy array: {e}", exc_info=True)
         return None
 
+_BOX_COLORS_BGR = {'fire': (0, 0, 255), 'smoke': (128, 128, 128)}
+
+def scale_and_draw_detections(frame_bgr, detected_objects, scale):
+    """
+    Menskalakan box hasil deteksi (yang dihitung pada frame yang sudah
+    diperkecil dengan faktor `scale`) kembali ke resolusi asli, lalu
+    menggambarkannya langsung pada frame penuh. Pengganti ringan untuk
+    results.plot() saat inferensi berjalan pada frame kecil.
+
+    Catatan: entri Detection di dalam list ikut DIGANTI (NamedTuple bersifat
+    immutable) dengan box koordinat resolusi penuh agar log/notifikasi
+    konsisten dengan tampilan.
+    """
+    for index, det in enumerate(detected_objects):
+        x1, y1, x2, y2 = (int(round(c / scale)) for c in det.box)
+        detected_objects[index] = det._replace(box=(x1, y1, x2, y2))
+        color = _BOX_COLORS_BGR.get(det.label.lower(), (0, 255, 0))
+        cv2.rectangle(frame_bgr, (x1, y1), (x2, y2), color, 2)
+        cv2.putText(frame_bgr, f"{det.label} {det.conf:.2f}",
+                    (x1, max(y1 - 6, 12)), cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+    return frame_bgr
+
+def image_bytes_to_bgr_numpy(image_bytes):
+    """
+    Mengkonversi data byte gambar langsung menjadi array NumPy BGR lewat
+    cv2.imdecode — tanpa instansiasi PIL dan tanpa konversi warna tambahan,
+    karena imdecode memang menghasilkan BGR secara native.
+    """
+    if not image_bytes:
+        logger.warning("image_bytes_to_bgr_numpy dipanggil dengan image_bytes kosong.")
+        return None
+    try:
+        image_bgr = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+        if image_bgr is None:
+            logger.error("cv2.imdecode gagal men-decode data gambar (format tidak dikenali?).")
+        return image_bgr
+    except Exception as e:
+        logger.error(f"Error saat men-decode image bytes ke NumPy array BGR: {e}", exc_info=True)
+        return None
+
+# Objek CLAHE dibuat sekali per THREAD, bukan per-frame: cv2.createCLAHE di
+# loop streaming adalah biaya alokasi tersendiri, sedangkan satu objek global
+# tidak aman dipakai bersama karena cv2.CLAHE menyimpan state histogram tile.
+_clahe_tls = threading.local()
+
+def _get_clahe():
+    clahe = getattr(_clahe_tls, 'clahe', None)
+    if clahe is None:
+        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+        _clahe_tls.clahe = clahe
+    return clahe
+
+def apply_clahe_bgr(image_bgr: np.ndarray):
+    """
+    Menerapkan CLAHE langsung pada frame BGR: satu konversi BGR->LAB, CLAHE
+    pada channel L saja, lalu satu konversi LAB->BGR. Jalur ini menghindari
+    bolak-balik RGB<->BGR tambahan yang dibutuhkan apply_clahe_enhancement.
+
+    Loop histogram/CDF per-tile sepenuhnya berjalan di C++ (cv2.CLAHE),
+    jadi tidak ada loop Python yang perlu di-JIT di jalur ini.
+    """
+    if image_bgr is None:
+        logger.warning("apply_clahe_bgr menerima input gambar None.")
+        return None
+    try:
+        # Validasi bentuk hanya pada mode debug: caller streaming selalu
+        # mengirim frame 3-channel, dan python -O menghapus blok ini.
+        if __debug__:
+            if image_bgr.ndim != 3 or image_bgr.shape[2] != 3:
+                logger.error("Input untuk CLAHE harus berupa gambar BGR (3 channel).")
+                return image_bgr
+
+        image_lab = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2LAB)
+        image_lab[:, :, 0] = _get_clahe().apply(image_lab[:, :, 0])
+        return cv2.cvtColor(image_lab, cv2.COLOR_LAB2BGR)
+    except cv2.error as e_cv:
+        logger.error(f"Error OpenCV saat menerapkan CLAHE (BGR): {e_cv}", exc_info=True)
+        return image_bgr
+    except Exception as e:
+        logger.error(f"Error umum saat menerapkan CLAHE (BGR): {e}", exc_info=True)
+        return image_bgr
+
+class ClaheEnhancer:
+    """
+    Varian CLAHE dengan buffer kerja yang dialokasikan SEKALI lalu dipakai
+    ulang antar frame lewat argumen dst=. Untuk stream beresolusi tetap ini
+    menghapus churn alokasi lima buffer ukuran-penuh (lab, l, a, b, out)
+    per frame; buffer dialokasikan ulang otomatis bila resolusi berubah.
+
+    Dengan downsample > 1, histogram CLAHE dihitung pada channel L yang
+    diperkecil faktor tersebut lalu hasilnya di-upsample kembali — kerja
+    histogram turun kuadratik terhadap faktor, sementara gain kontras lokal
+    pada tile besar praktis tidak berubah.
+
+    Dengan simple_contrast=True, frame referensi pertama membangun LUT
+    contrast-stretch global dari histogram L-nya; frame berikutnya cukup satu
+    pass cv2.LUT sampai caller memanggil invalidate_lut() (scene berubah),
+    yang memaksa CLAHE penuh + LUT referensi baru.
+
+    Catatan: instance TIDAK thread-safe (buffer internal dipakai bergantian);
+    buat satu instance per thread pemroses. Frame hasil enhance_bgr menunjuk
+    ke buffer internal dan hanya valid sampai pemanggilan berikutnya.
+    """
+
+    def __init__(self, clip_limit: float = 2.0, tile_grid_size=(8, 8), downsample: int = 1,
+                 simple_contrast: bool = False):
+        self._clahe = cv2.createCLAHE(clipLimit=clip_limit, tileGridSize=tile_grid_size)
+        self._downsample = max(int(downsample), 1)
+        self._simple_contrast = simple_contrast
+        self._lut = None
+        self._shape = None
+        self._lab = None
+        self._l = None
+        self._l_small = None
+        self._a = None
+        self._b = None
+        self._out = None
+
+    def _ensure_buffers(self, shape):
+        if shape == self._shape:
+            return
+        height, width = shape[:2]
+        self._lab = np.empty((height, width, 3), dtype=np.uint8)
+        self._l = np.empty((height, width), dtype=np.uint8)
+        self._a = np.empty((height, width), dtype=np.uint8)
+        self._b = np.empty((height, width), dtype=np.uint8)
+        self._out = np.empty((height, width, 3), dtype=np.uint8)
+        if self._downsample > 1:
+            small_h = max(height // self._downsample, 1)
+            small_w = max(width // self._downsample, 1)
+            self._l_small = np.empty((small_h, small_w), dtype=np.uint8)
+        self._shape = shape
+
+    def _apply_clahe_l(self):
+        """CLAHE penuh pada buffer L (dengan downsample bila dikonfigurasi)."""
+        if self._downsample > 1:
+            small_h, small_w = self._l_small.shape
+            cv2.resize(self._l, (small_w, small_h), dst=self._l_small,
+                       interpolation=cv2.INTER_AREA)
+            self._clahe.apply(self._l_small, dst=self._l_small)
+            cv2.resize(self._l_small, (self._l.shape[1], self._l.shape[0]),
+                       dst=self._l, interpolation=cv2.INTER_LINEAR)
+        else:
+            self._clahe.apply(self._l, dst=self._l)
+
+    @staticmethod
+    def _build_stretch_lut(l_channel: np.ndarray) -> np.ndarray:
+        """LUT contrast-stretch 256 entri dari histogram channel L: persentil
+        1%..99% CDF direntangkan linear ke 0..255 lewat np.interp."""
+        hist = cv2.calcHist([l_channel], [0], None, [256], [0, 256]).ravel()
+        cdf = hist.cumsum()
+        cdf /= cdf[-1]
+        low_cut = float(np.searchsorted(cdf, 0.01))
+        high_cut = float(np.searchsorted(cdf, 0.99))
+        if high_cut <= low_cut:  # Frame nyaris satu warna: LUT identitas
+            return np.arange(256, dtype=np.uint8)
+        return np.interp(np.arange(256), [0.0, low_cut, high_cut, 255.0],
+                         [0.0, 0.0, 255.0, 255.0]).astype(np.uint8)
+
+    def invalidate_lut(self):
+        """Membatalkan LUT simple-contrast; frame berikutnya menjadi frame
+        referensi baru dan melewati CLAHE penuh (dipanggil saat scene cut).
+        No-op bila mode simple-contrast tidak aktif."""
+        self._lut = None
+
+    def enhance_bgr(self, image_bgr: np.ndarray):
+        """CLAHE pada channel L dari frame BGR, tanpa alokasi per frame."""
+        if image_bgr is None:
+            logger.warning("ClaheEnhancer.enhance_bgr menerima input gambar None.")
+            return None
+        try:
+            if __debug__:
+                if image_bgr.ndim != 3 or image_bgr.shape[2] != 3:
+                    logger.error("Input untuk CLAHE harus berupa gambar BGR (3 channel).")
+                    return image_bgr
+
+            self._ensure_buffers(image_bgr.shape)
+            cv2.cvtColor(image_bgr, cv2.COLOR_BGR2LAB, dst=self._lab)
+            cv2.split(self._lab, [self._l, self._a, self._b])
+            if self._simple_contrast:
+                if self._lut is None:
+                    # Frame referensi: bangun LUT stretch dari histogram L-nya,
+                    # lalu frame ini sendiri tetap melewati CLAHE penuh.
+                    self._lut = self._build_stretch_lut(self._l)
+                    self._apply_clahe_l()
+                else:
+                    # Satu pass cv2.LUT (SIMD) menggantikan seluruh kerja
+                    # histogram per-tile CLAHE selama scene masih seragam.
+                    cv2.LUT(self._l, self._lut, dst=self._l)
+            else:
+                self._apply_clahe_l()
+            cv2.merge([self._l, self._a, self._b], dst=self._lab)
+            cv2.cvtColor(self._lab, cv2.COLOR_LAB2BGR, dst=self._out)
+            return self._out
+        except cv2.error as e_cv:
+            logger.error(f"Error OpenCV saat menerapkan CLAHE (buffer reuse): {e_cv}", exc_info=True)
+            return image_bgr
+        except Exception as e:
+            logger.error(f"Error umum saat menerapkan CLAHE (buffer reuse): {e}", exc_info=True)
+            return image_bgr
+
 def apply_clahe_enhancement(image_rgb: np.ndarray):
     """
     Menerapkan Contrast Limited Adaptive Histogram Equalization (CLAHE)
-    pada gambar RGB untuk meningkatkan kontras lokal.
+    pada gambar RGB untuk meningkatkan kontras lokal. Implementasi CLAHE-nya
+    sendiri memakai cv2.CLAHE (C++), bukan loop tile di Python.
     """
     if image_rgb is None:
         logger.warning("apply_clahe_enhancement menerima input gambar None.")
         return None
     try:
-        if image_rgb.ndim != 3 or image_rgb.shape[2] != 3:
-            logger.error("Input untuk CLAHE harus berupa gambar RGB (3 channel).")
-            return image_rgb 
+        # Validasi bentuk hanya pada mode debug (python -O menghapusnya):
+        # di jalur produksi input selalu frame 3-channel berukuran tetap.
+        if __debug__:
+            if image_rgb.ndim != 3 or image_rgb.shape[2] != 3:
+                logger.error("Input untuk CLAHE harus berupa gambar RGB (3 channel).")
+                return image_rgb
 
         image_lab = cv2.cvtColor(image_rgb, cv2.COLOR_RGB2LAB)
         l_channel, a_channel, b_channel = cv2.split(image_lab)
-        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-        cl = clahe.apply(l_channel) 
+        cl = _get_clahe().apply(l_channel)
         enhanced_lab_image = cv2.merge((cl, a_channel, b_channel))
         enhanced_rgb_image = cv2.cvtColor(enhanced_lab_image, cv2.COLOR_LAB2RGB)
-        logger.info("Enhancement CLAHE berhasil diterapkan.")
+        # DEBUG, bukan INFO: pesan sukses per-frame membanjiri log streaming.
+        logger.debug("Enhancement CLAHE berhasil diterapkan.")
         return enhanced_rgb_image
     except cv2.error as e_cv: 
         logger.error(f"Error OpenCV saat menerapkan CLAHE: {e_cv}", exc_info=True)